@@ -0,0 +1,391 @@
+# Bitboard backend for the gameState. Keeps one 64-bit integer per piece type and color next to the 8x8 board and generates legal moves from precomputed attack masks.
+
+from chessEngineSmart import gameState, Move
+
+#Squares are numbered row * 8 + col, so square 0 is a8 and square 63 is h1. This matches the orientation of gameState.board.
+
+FULL_BOARD = 0xFFFFFFFFFFFFFFFF
+
+#First 4 directions are for Rooks, last 4 are for Bishops (same order as gameState.pinsOrChecks). Queens use all 8.
+
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+ROOK_DIRECTIONS = (0, 1, 2, 3)
+BISHOP_DIRECTIONS = (4, 5, 6, 7)
+POSITIVE_DIRECTION = tuple(d[0] * 8 + d[1] > 0 for d in DIRECTIONS) #Does the square index grow along the ray? Decides if the first blocker is the lowest or highest bit.
+
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+#Builds a mask of every square reachable from each square with a single step.
+
+def buildStepAttacks(steps):
+    attacks = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        mask = 0
+        for dRow, dCol in steps:
+            endRow = row + dRow
+            endCol = col + dCol
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                mask |= 1 << (endRow * 8 + endCol)
+        attacks.append(mask)
+    return attacks
+
+#Builds, for every direction, the mask of squares a slider would see on an empty board.
+
+def buildRays():
+    rays = []
+    for dRow, dCol in DIRECTIONS:
+        directionRays = []
+        for square in range(64):
+            row, col = divmod(square, 8)
+            mask = 0
+            for i in range(1, 8):
+                endRow = row + dRow * i
+                endCol = col + dCol * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                mask |= 1 << (endRow * 8 + endCol)
+            directionRays.append(mask)
+        rays.append(directionRays)
+    return rays
+
+#Builds the mask of squares strictly between two squares on the same line (0 if they are not aligned).
+
+def buildBetween():
+    between = [[0] * 64 for _ in range(64)]
+    for start in range(64):
+        row, col = divmod(start, 8)
+        for dRow, dCol in DIRECTIONS:
+            mask = 0
+            for i in range(1, 8):
+                endRow = row + dRow * i
+                endCol = col + dCol * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                end = endRow * 8 + endCol
+                between[start][end] = mask
+                mask |= 1 << end
+    return between
+
+KNIGHT_ATTACKS = buildStepAttacks(KNIGHT_STEPS)
+KING_ATTACKS = buildStepAttacks(KING_STEPS)
+PAWN_ATTACKS = {"w": buildStepAttacks(((-1, -1), (-1, 1))), "b": buildStepAttacks(((1, -1), (1, 1)))} #Squares a Pawn of that color attacks.
+RAYS = buildRays()
+BETWEEN = buildBetween()
+
+#Index of the lowest set bit.
+
+def lowestSquare(bitboard):
+    return (bitboard & -bitboard).bit_length() - 1
+
+#Yields the index of every set bit, lowest first.
+
+def squares(bitboard):
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+#Squares a slider on 'square' sees in direction 'd', stopping at (and including) the first occupied square.
+
+def rayAttacks(square, occupied, d):
+    attacks = RAYS[d][square]
+    blockers = attacks & occupied
+    if blockers:
+        if POSITIVE_DIRECTION[d]:
+            blocker = (blockers & -blockers).bit_length() - 1
+        else:
+            blocker = blockers.bit_length() - 1
+        attacks ^= RAYS[d][blocker]
+    return attacks
+
+def rookAttacks(square, occupied):
+    return rayAttacks(square, occupied, 0) | rayAttacks(square, occupied, 1) | rayAttacks(square, occupied, 2) | rayAttacks(square, occupied, 3)
+
+def bishopAttacks(square, occupied):
+    return rayAttacks(square, occupied, 4) | rayAttacks(square, occupied, 5) | rayAttacks(square, occupied, 6) | rayAttacks(square, occupied, 7)
+
+class bitboardGameState(gameState):
+
+    def __init__(self):
+        gameState.__init__(self)
+        self.loadBitboards()
+
+    #Rebuilds every bitboard from self.board. Piece bitboards are keyed by the same 2 character strings used on the board ("wP", "bK"...).
+
+    def loadBitboards(self):
+        self.pieceBitboards = {color + piece: 0 for color in "wb" for piece in "PNBRQK"}
+        self.colorBitboards = {"w": 0, "b": 0}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    bit = 1 << (row * 8 + col)
+                    self.pieceBitboards[piece] |= bit
+                    self.colorBitboards[piece[0]] |= bit
+
+    def loadFEN(self, fen):
+        gameState.loadFEN(self, fen)
+        self.loadBitboards()
+
+    def makeMove(self, move):
+        gameState.makeMove(self, move)
+        self.toggleMove(move)
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            gameState.undoMove(self)
+            self.toggleMove(move)
+
+    #Flips every bit a move touches. XOR is its own inverse, so the same call both makes and unmakes the move.
+
+    def toggleMove(self, move):
+        pieces = self.pieceBitboards
+        colors = self.colorBitboards
+        color = move.pieceMoved[0]
+        startBit = 1 << (move.startRow * 8 + move.startCol)
+        endBit = 1 << (move.endRow * 8 + move.endCol)
+        pieces[move.pieceMoved] ^= startBit
+        if move.pawnPromotion:
+            pieces[color + move.promotionChoice] ^= endBit
+        else:
+            pieces[move.pieceMoved] ^= endBit
+        colors[color] ^= startBit | endBit
+        if move.pieceCaptured != "--":
+            if move.enPassant:
+                captureBit = 1 << (move.startRow * 8 + move.endCol)
+            else:
+                captureBit = endBit
+            pieces[move.pieceCaptured] ^= captureBit
+            colors[move.pieceCaptured[0]] ^= captureBit
+        if move.castleMove:
+            rowOffset = move.endRow * 8
+            if move.endCol - move.startCol == 2: #Kingside Castle move.
+                rookBits = (1 << (rowOffset + move.endCol + 1)) | (1 << (rowOffset + move.endCol - 1))
+            else: #Queenside Castle move.
+                rookBits = (1 << (rowOffset + move.endCol - 2)) | (1 << (rowOffset + move.endCol + 1))
+            pieces[color + "R"] ^= rookBits
+            colors[color] ^= rookBits
+
+    #Determine if a piece of 'color' attacks 'square' given the occupancy 'occupied'.
+
+    def squareAttackedBy(self, square, color, occupied):
+        pieces = self.pieceBitboards
+        if KNIGHT_ATTACKS[square] & pieces[color + "N"]:
+            return True
+        if KING_ATTACKS[square] & pieces[color + "K"]:
+            return True
+        if PAWN_ATTACKS["b" if color == "w" else "w"][square] & pieces[color + "P"]: #A Pawn attacks 'square' if an enemy Pawn on 'square' would attack it back.
+            return True
+        queens = pieces[color + "Q"]
+        rooks = pieces[color + "R"] | queens
+        if rooks and rookAttacks(square, occupied) & rooks:
+            return True
+        bishops = pieces[color + "B"] | queens
+        if bishops and bishopAttacks(square, occupied) & bishops:
+            return True
+        return False
+
+    #Bitboard of every piece of 'color' attacking 'square'.
+
+    def attackersTo(self, square, color, occupied):
+        pieces = self.pieceBitboards
+        queens = pieces[color + "Q"]
+        return (KNIGHT_ATTACKS[square] & pieces[color + "N"]) | \
+            (KING_ATTACKS[square] & pieces[color + "K"]) | \
+            (PAWN_ATTACKS["b" if color == "w" else "w"][square] & pieces[color + "P"]) | \
+            (rookAttacks(square, occupied) & (pieces[color + "R"] | queens)) | \
+            (bishopAttacks(square, occupied) & (pieces[color + "B"] | queens))
+
+    def isCheck(self):
+        allyColor = "w" if self.whiteToMove else "b"
+        enemyColor = "b" if self.whiteToMove else "w"
+        occupied = self.colorBitboards["w"] | self.colorBitboards["b"]
+        return self.squareAttackedBy(lowestSquare(self.pieceBitboards[allyColor + "K"]), enemyColor, occupied)
+
+    def squareUnderAttack(self, row, col):
+        enemyColor = "b" if self.whiteToMove else "w"
+        occupied = self.colorBitboards["w"] | self.colorBitboards["b"]
+        return self.squareAttackedBy(row * 8 + col, enemyColor, occupied)
+
+    #Returns a dictionary of square -> mask of squares the pinned piece on that square may still move to (along the pin, including capturing the pinner).
+
+    def getPinMasks(self, kingSquare, allyColor, enemyColor, occupied):
+        pieces = self.pieceBitboards
+        allies = self.colorBitboards[allyColor]
+        queens = pieces[enemyColor + "Q"]
+        rooks = pieces[enemyColor + "R"] | queens
+        bishops = pieces[enemyColor + "B"] | queens
+        pinMasks = {}
+        for d in range(8):
+            sliders = rooks if d < 4 else bishops
+            if not RAYS[d][kingSquare] & sliders: #No enemy slider on this line at all.
+                continue
+            blocker = rayAttacks(kingSquare, occupied, d) & occupied
+            if not blocker & allies:
+                continue
+            pinner = rayAttacks(lowestSquare(blocker), occupied, d) & occupied & sliders
+            if pinner:
+                pinMasks[lowestSquare(blocker)] = BETWEEN[kingSquare][lowestSquare(pinner)] | pinner
+        return pinMasks
+
+    #Gets all moves considering Checks, same contract as gameState.getValidMoves.
+
+    def getValidMoves(self):
+        moves = self.generateMoves(False)
+        if len(moves) == 0:
+            if self.inCheck:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return moves
+
+    #Gets only the legal captures and promotions (En Passant included). Used by quiescence search, checkmate/stalemate are left alone.
+
+    def getCaptureMoves(self):
+        return self.generateMoves(True)
+
+    #Gets only the legal non-capturing, non-promoting moves and castling, the moves getCaptureMoves leaves out.
+
+    def getQuietMoves(self):
+        return self.generateMoves(False, True)
+
+    #Finds the legal move with this moveID, or None if there is none. Only the piece on the start square is generated.
+
+    def getMoveFromID(self, moveID):
+        startSquare = moveID // 1000 % 10 * 8 + moveID // 100 % 10
+        for move in self.generateMoves(False, False, 1 << startSquare):
+            if move.moveID == moveID:
+                return move
+        return None
+
+    #Legal move generator behind getValidMoves, getCaptureMoves and getQuietMoves. With capturesOnly the target squares are limited to enemy pieces (plus promotion pushes),
+    #with quietsOnly to empty squares (minus promotion pushes). Only pieces standing on 'fromSquares' are generated.
+
+    def generateMoves(self, capturesOnly, quietsOnly = False, fromSquares = FULL_BOARD):
+        moves = []
+        board = self.board
+        pieces = self.pieceBitboards
+        if self.whiteToMove:
+            allyColor, enemyColor = "w", "b"
+        else:
+            allyColor, enemyColor = "b", "w"
+        allies = self.colorBitboards[allyColor]
+        enemies = self.colorBitboards[enemyColor]
+        occupied = allies | enemies
+        kingSquare = lowestSquare(pieces[allyColor + "K"])
+        kingRow, kingCol = divmod(kingSquare, 8)
+        if allyColor == "w":
+            self.whiteKingLocation = (kingRow, kingCol)
+        else:
+            self.blackKingLocation = (kingRow, kingCol)
+        checkers = self.attackersTo(kingSquare, enemyColor, occupied)
+        self.inCheck = checkers != 0
+        self.pins = []
+        self.checks = []
+
+        #King moves. The King is removed from the occupancy so it cannot hide behind itself from a slider.
+
+        withoutKing = occupied ^ (1 << kingSquare)
+        if capturesOnly:
+            targets = enemies
+        elif quietsOnly:
+            targets = ~occupied
+        else:
+            targets = ~allies
+        kingTargets = KING_ATTACKS[kingSquare] & targets if (1 << kingSquare) & fromSquares else 0
+        for end in squares(kingTargets):
+            if not self.squareAttackedBy(end, enemyColor, withoutKing):
+                moves.append(Move((kingRow, kingCol), divmod(end, 8), board))
+
+        if checkers & (checkers - 1) == 0: #Not in double Check, other pieces may move.
+            if checkers:
+                checkMask = BETWEEN[kingSquare][lowestSquare(checkers)] | checkers #Must block or capture.
+            else:
+                checkMask = FULL_BOARD
+            pinMasks = self.getPinMasks(kingSquare, allyColor, enemyColor, occupied)
+            targets &= checkMask
+
+            for start in squares(pieces[allyColor + "N"] & fromSquares):
+                if start in pinMasks: #A pinned Knight can never move.
+                    continue
+                startSq = divmod(start, 8)
+                for end in squares(KNIGHT_ATTACKS[start] & targets):
+                    moves.append(Move(startSq, divmod(end, 8), board))
+
+            queens = pieces[allyColor + "Q"]
+            for start in squares((pieces[allyColor + "B"] | queens) & fromSquares):
+                startSq = divmod(start, 8)
+                for end in squares(bishopAttacks(start, occupied) & targets & pinMasks.get(start, FULL_BOARD)):
+                    moves.append(Move(startSq, divmod(end, 8), board))
+            for start in squares((pieces[allyColor + "R"] | queens) & fromSquares):
+                startSq = divmod(start, 8)
+                for end in squares(rookAttacks(start, occupied) & targets & pinMasks.get(start, FULL_BOARD)):
+                    moves.append(Move(startSq, divmod(end, 8), board))
+
+            self.getPawnBitboardMoves(allyColor, enemies, occupied, kingSquare, checkers, checkMask, pinMasks, moves, capturesOnly, quietsOnly, fromSquares)
+            if not checkers and not capturesOnly and (1 << kingSquare) & fromSquares:
+                self.getCastleBitboardMoves(kingRow, kingCol, enemyColor, occupied, moves)
+        return moves
+
+    def getPawnBitboardMoves(self, allyColor, enemies, occupied, kingSquare, checkers, checkMask, pinMasks, moves, capturesOnly = False, quietsOnly = False, fromSquares = FULL_BOARD):
+        board = self.board
+        if allyColor == "w":
+            moveAmount = -8
+            startRow = 6
+            backRow = 0
+            enemyColor = "b"
+        else:
+            moveAmount = 8
+            startRow = 1
+            backRow = 7
+            enemyColor = "w"
+        pawnAttacks = PAWN_ATTACKS[allyColor]
+        if self.enPassantPossible:
+            enPassantBit = 1 << (self.enPassantPossible[0] * 8 + self.enPassantPossible[1])
+        else:
+            enPassantBit = 0
+        for start in squares(self.pieceBitboards[allyColor + "P"] & fromSquares):
+            row, col = divmod(start, 8)
+            allowed = checkMask & pinMasks.get(start, FULL_BOARD)
+            pawnPromotion = row + moveAmount // 8 == backRow
+            end = start + moveAmount
+            if not (1 << end) & occupied and ((pawnPromotion and not quietsOnly) or not (pawnPromotion or capturesOnly)): #1-Square Pawn advance, a promotion counts with the captures, anything else with the quiet moves.
+                if (1 << end) & allowed:
+                    self.addPawnMove((row, col), divmod(end, 8), moves, pawnPromotion)
+                end += moveAmount
+                if row == startRow and not capturesOnly and not (1 << end) & occupied and (1 << end) & allowed: #2-Square Pawn advance
+                    moves.append(Move((row, col), divmod(end, 8), board))
+            if quietsOnly:
+                continue
+            for end in squares(pawnAttacks[start] & enemies & allowed):
+                self.addPawnMove((row, col), divmod(end, 8), moves, pawnPromotion)
+            if pawnAttacks[start] & enPassantBit:
+                captureSquare = row * 8 + self.enPassantPossible[1]
+                if checkers and not (enPassantBit & checkMask or checkers == 1 << captureSquare):
+                    continue #En Passant neither blocks nor removes the checking piece.
+                #Replay the capture on the occupancy and make sure no slider now sees the King (covers pins along the rank and the diagonal).
+                after = (occupied ^ (1 << start) ^ (1 << captureSquare)) | enPassantBit
+                pieces = self.pieceBitboards
+                queens = pieces[enemyColor + "Q"]
+                if rookAttacks(kingSquare, after) & (pieces[enemyColor + "R"] | queens):
+                    continue
+                if bishopAttacks(kingSquare, after) & (pieces[enemyColor + "B"] | queens):
+                    continue
+                moves.append(Move((row, col), self.enPassantPossible, board, enPassant = True))
+
+    def getCastleBitboardMoves(self, row, col, enemyColor, occupied, moves):
+        square = row * 8 + col
+        if (self.whiteToMove and self.currentCastlingRights.wks) or (not self.whiteToMove and self.currentCastlingRights.bks):
+            if not occupied & ((1 << (square + 1)) | (1 << (square + 2))) and \
+            not self.squareAttackedBy(square + 1, enemyColor, occupied) and not self.squareAttackedBy(square + 2, enemyColor, occupied):
+                moves.append(Move((row, col), (row, col + 2), self.board, castleMove = True))
+        if (self.whiteToMove and self.currentCastlingRights.wqs) or (not self.whiteToMove and self.currentCastlingRights.bqs):
+            if not occupied & ((1 << (square - 1)) | (1 << (square - 2)) | (1 << (square - 3))) and \
+            not self.squareAttackedBy(square - 1, enemyColor, occupied) and not self.squareAttackedBy(square - 2, enemyColor, occupied):
+                moves.append(Move((row, col), (row, col - 2), self.board, castleMove = True))
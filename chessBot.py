@@ -1,9 +1,179 @@
+import json
+import multiprocessing
 import random as r
+import time
+from multiprocessing import shared_memory
+import chessEvaluation
+import chessBook
+import chessTablebase
 
 pointsOfMaterial = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
-CHECKMATE = 1000
+CHECKMATE = 100000 #Larger than any centipawn evaluation. Being mated 'ply' plies below the root scores -CHECKMATE + ply, so the sooner the mate the bigger the score.
+MATE_SCORE = CHECKMATE - 1000 #Scores at least this far from 0 are mate scores.
 STALEMATE = 0
-DEPTH = 5
+DEPTH = 5 #Fixed depth of the old minMax/negaMax searches. findBestMove deepens until its budget runs out instead.
+MAX_DEPTH = 64 #Deepest iteration findBestMove will start.
+TIME_LIMIT = 3.0 #Seconds findBestMove may spend on one move (None for no limit).
+NODE_LIMIT = None #Nodes findBestMove may search for one move (None for no limit).
+CHECK_EVERY = 1024 #Nodes between clock checks.
+BATCH_EVALUATION = False #Score the children of depth 1 nodes in one NumPy pass (chessEvaluation.scorePositions) instead of running quiescence on each. Needs NumPy.
+TT_SIZE = 1 << 18 #Number of transposition table entries.
+NULL_MOVE = True #Null-move pruning: pass the turn and search shallower, a node that still fails high for the side to move is cut.
+NULL_MOVE_REDUCTION = 2 #Plies the null-move search is reduced by, on top of the ply passed.
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_VERIFY_MATERIAL = chessEvaluation.PIECE_VALUES["R"] #Zugzwang-prone: with this much piece material or less, a null-move cutoff must be confirmed by a reduced normal search. With none, no null move is tried.
+LATE_MOVE_REDUCTIONS = True #Search quiet moves ordered late with a reduced null window search first, and at full depth only if they beat alpha.
+LMR_MIN_DEPTH = 3
+LMR_FULL_MOVES = 3 #Moves searched at full depth at every node before reductions start.
+LMR_REDUCTION = 1
+PRINCIPAL_VARIATION_SEARCH = True #Search every move after the first with a null window, and again with the full window only if it beats alpha.
+ASPIRATION_WINDOW = 50 #Centipawns either side of the last iteration's score the next iteration's root window starts with (0 for a full window).
+USE_BOOK = True #Play straight from the Polyglot opening book at chessBook.BOOK_PATH while the position is in it.
+SMP_WORKERS = 1 #Search processes. 1 is the single-process search, more run chessParallel's Lazy SMP search on a shared transposition table.
+COLLECT_STATISTICS = False #Count cutoffs and transposition table hits and time move generation, make/unmake and evaluation during every search (see startStatistics).
+USE_TABLEBASES = True #Play and score positions of up to chessTablebase.MAX_PIECES pieces from the endgame tables in chessTablebase.TABLEBASE_DIR.
+TABLEBASE_MATERIAL = 2 * chessEvaluation.PIECE_VALUES["Q"] #No table position has more material than this (two Queens besides the Kings), richer positions skip the lookup.
+
+#Transposition table bound types.
+
+EXACT = 0
+LOWER_BOUND = 1 #Search failed high, the real score is at least the stored score.
+UPPER_BOUND = 2 #Search failed low, the real score is at most the stored score.
+
+table = None #Transposition table used by negaMaxAB, created on the first search.
+book = None #Opening book, opened on the first search (False if there is no book file).
+tablebases = None #Endgame tables, opened on the first lookup (False if there are none).
+
+#Move ordering scores, higher is searched first. Captures add MVV-LVA on top of CAPTURE_SCORE, quiet moves score their history value.
+
+PV_MOVE_SCORE = 2000000
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+PROMOTION_SCORE = 95000
+KILLER_SCORE = 90000 #First killer slot, the second scores one less.
+HISTORY_MAX = 50000 #The history table is halved once an entry passes this, so it stays below the killer scores.
+
+killers = [[None, None] for _ in range(MAX_DEPTH + 1)] #Two quiet move IDs per ply that recently caused a beta cutoff.
+history = {color + piece: [0] * 64 for color in "wb" for piece in "PNBRQK"} #Beta cutoff credit per piece and destination square.
+
+#Search state shared by findBestMove and negaMaxAB.
+
+nextMove = None #Best root move of the iteration being searched.
+rootDepth = 0 #Depth of the iteration being searched, negaMaxAB is at the root when depth == rootDepth.
+rootPly = 0 #len(gs.zobristKeyLog) at the root. A node's ply is counted from it, so reduced and null-move searches still know how far below the root they are.
+nodesSearched = 0
+deadline = None #time.perf_counter() value at which the search stops.
+searchNodeLimit = None
+stopSearch = False #Set once the budget runs out, every node then returns immediately and the iteration is thrown away.
+previousPV = [] #Move IDs of the last completed iteration's principal variation.
+followPV = False #True while negaMaxAB is walking down previousPV.
+pvTable = [[None] * (MAX_DEPTH + 2) for _ in range(MAX_DEPTH + 2)] #Triangular PV array. Row 'ply' holds the best line found from that ply, in columns ply to pvLength[ply] - 1.
+pvLength = [0] * (MAX_DEPTH + 2)
+stopRequest = None #Function returning True once another process wants the search stopped (see chessEngineWorker), checked with the clock.
+statistics = None #Counters of the last search while COLLECT_STATISTICS is on, otherwise None.
+
+#Fixed-size transposition table indexed by Zobrist key. Entries live in parallel lists so no object is allocated per stored position.
+#The table is kept from one search to the next. Each entry remembers the search that stored it, so entries left over from earlier moves can be replaced.
+
+class transpositionTable():
+
+    def __init__(self, size = TT_SIZE):
+        self.size = size
+        self.age = 0
+        self.clear()
+
+    def clear(self):
+        self.keys = [None] * self.size
+        self.depths = [-1] * self.size
+        self.flags = [EXACT] * self.size
+        self.scores = [0] * self.size
+        self.moveIDs = [None] * self.size
+        self.ages = [0] * self.size
+
+    #Called at the start of every search, entries stored before this are now stale.
+
+    def newSearch(self):
+        self.age += 1
+
+    #Returns (depth, bound type, score, best move ID) stored for 'key', or None if the position is not in the table.
+
+    def probe(self, key):
+        index = key % self.size
+        if self.keys[index] == key:
+            return self.depths[index], self.flags[index], self.scores[index], self.moveIDs[index]
+        return None
+
+    #Depth-preferred replacement: an entry for a different position is only overwritten by a search at least as deep, or if an earlier search stored it.
+
+    def store(self, key, depth, flag, score, moveID):
+        index = key % self.size
+        if self.keys[index] != key and depth < self.depths[index] and self.ages[index] == self.age:
+            return
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.flags[index] = flag
+        self.scores[index] = score
+        self.moveIDs[index] = moveID
+        self.ages[index] = self.age
+
+#Transposition table in shared memory, so several search processes can use one table (see chessParallel). Same probe/store/newSearch interface as transpositionTable.
+#Each entry is two 64-bit words: the entry packed into one int, and the Zobrist key XOR-ed with it. There are no locks. A probe only trusts an entry if the key still matches after undoing the XOR,
+#so an entry half written by another process reads as a miss instead of as a wrong entry.
+#Packed entry: move ID + 1 (bits 0-15, 0 for no move), score + SCORE_OFFSET (16-39), depth + 1 (40-47), bound type (48-49), search age (50-57).
+
+SCORE_OFFSET = 1 << 23
+
+class sharedTranspositionTable():
+
+    #Creates a new table, or attaches to the existing shared memory block called 'name'.
+
+    def __init__(self, size = TT_SIZE, name = None):
+        self.size = size
+        self.age = 0
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create = True, size = size * 16)
+        else:
+            self.memory = shared_memory.SharedMemory(name = name)
+        self.name = self.memory.name
+        self.words = self.memory.buf.cast("Q")
+
+    #Pickled by name, another process attaches to the same memory instead of copying it.
+
+    def __reduce__(self):
+        return (sharedTranspositionTable, (self.size, self.name))
+
+    def clear(self):
+        for i in range(2 * self.size):
+            self.words[i] = 0
+
+    def newSearch(self):
+        self.age += 1
+
+    def probe(self, key):
+        index = 2 * (key % self.size)
+        data = self.words[index + 1]
+        if self.words[index] ^ data != key or data == 0:
+            return None
+        moveID = (data & 0xFFFF) - 1
+        return (data >> 40 & 0xFF) - 1, data >> 48 & 3, (data >> 16 & 0xFFFFFF) - SCORE_OFFSET, moveID if moveID >= 0 else None
+
+    def store(self, key, depth, flag, score, moveID):
+        index = 2 * (key % self.size)
+        old = self.words[index + 1]
+        if old != 0 and self.words[index] ^ old != key and depth < (old >> 40 & 0xFF) - 1 and old >> 50 & 0xFF == self.age & 0xFF:
+            return
+        data = (moveID + 1 if moveID is not None else 0) | (score + SCORE_OFFSET) << 16 | (depth + 1) << 40 | flag << 48 | (self.age & 0xFF) << 50
+        self.words[index] = key ^ data
+        self.words[index + 1] = data
+
+    #Every process calls close when done with the table, the process that created it then calls unlink to free the memory.
+
+    def close(self):
+        self.words.release()
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
 
 #Random move finder.
 
@@ -44,14 +214,334 @@ def findBestMoveOld(gs, validMoves):
         gs.undoMove()
     return bestPlayerMove
 
-#Helper method for minMax(). Used to make first recursive call.
+#Iterative deepening driver. Searches depth 1, 2, 3... until the time or node budget runs out and puts the best move of the last completed iteration on returnQueue
+#(None in a checkmate or stalemate, where there is no move to search).
+#With COLLECT_STATISTICS on it puts (best move, statistics) instead, every reader of returnQueue has to unpack it then.
 
-def findBestMove(gs, validMoves, returnQueue):
-    global nextMove
-    nextMove = None
-    r.shuffle(validMoves)
-    negaMaxAB(gs, validMoves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-    returnQueue.put(nextMove)
+def findBestMove(gs, validMoves, returnQueue, timeLimit = TIME_LIMIT, nodeLimit = NODE_LIMIT, maxDepth = MAX_DEPTH, reportIteration = None):
+    bestMove = iterativeDeepening(gs, validMoves, timeLimit, nodeLimit, maxDepth, reportIteration)
+    returnQueue.put((bestMove, statistics) if COLLECT_STATISTICS else bestMove)
+
+#'reportIteration', if given, is called after every completed iteration with (depth, score for the side to move, nodes, seconds, principal variation as move IDs).
+#Lazy SMP helpers (chessParallel) pass a 'startDepth' above 1 so their iterations are staggered against the other processes.
+
+#With SMP_WORKERS above 1 the search is handed to chessParallel.lazySMPSearch (no statistics are collected then). A daemonic process, such as a Pool worker,
+#cannot start the search processes and searches on its own.
+
+def iterativeDeepening(gs, validMoves, timeLimit = TIME_LIMIT, nodeLimit = NODE_LIMIT, maxDepth = MAX_DEPTH, reportIteration = None, startDepth = 1):
+    global statistics
+    if SMP_WORKERS > 1 and not multiprocessing.current_process().daemon:
+        import chessParallel #Imported here, chessParallel imports chessBot.
+        statistics = None
+        return chessParallel.lazySMPSearch(gs, SMP_WORKERS, timeLimit, nodeLimit, maxDepth, reportIteration)[0]
+    if not COLLECT_STATISTICS:
+        statistics = None
+        return searchIterations(gs, validMoves, timeLimit, nodeLimit, maxDepth, reportIteration, startDepth)
+    statistics = startStatistics(gs)
+    try:
+        return searchIterations(gs, validMoves, timeLimit, nodeLimit, maxDepth, reportIteration, startDepth)
+    finally:
+        finishStatistics(gs)
+
+#Every iteration after the first searches the root with an aspiration window of ASPIRATION_WINDOW around the last score. A score outside it is only a bound,
+#so the iteration is searched again with that side of the window opened up.
+
+def searchIterations(gs, validMoves, timeLimit, nodeLimit, maxDepth, reportIteration, startDepth):
+    global nextMove, table, rootDepth, rootPly, nodesSearched, deadline, searchNodeLimit, stopSearch, previousPV, followPV
+    if table is None or table.size != TT_SIZE:
+        table = transpositionTable(TT_SIZE)
+    table.newSearch()
+    if statistics is not None:
+        table.probe = countProbes(table.probe)
+    searchNodeLimit = nodeLimit
+    startTime = time.perf_counter()
+    deadline = startTime + timeLimit if timeLimit is not None else None
+    nodesSearched = 0
+    stopSearch = False
+    previousPV = []
+    if not validMoves:
+        return None #Checkmate or stalemate, the game is over.
+    if USE_BOOK:
+        bookMove = getBookMove(gs)
+        if bookMove is not None:
+            return bookMove #In book, no search needed.
+    if USE_TABLEBASES:
+        tablebaseMove = getTablebaseMove(gs, validMoves)
+        if tablebaseMove is not None:
+            return tablebaseMove #The tables know the result, no search needed.
+    clearMoveOrdering()
+    bestMove = None
+    r.shuffle(validMoves) #Randomness is kept for variety between equal moves. Ordering sorts are stable, so it breaks ties.
+    if len(validMoves) == 1:
+        return validMoves[0] #Nothing to think about.
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    rootPly = len(gs.zobristKeyLog)
+    score = None
+    for depth in range(startDepth, maxDepth + 1):
+        rootDepth = depth
+        if ASPIRATION_WINDOW > 0 and score is not None and abs(score) < CHECKMATE // 2:
+            alpha, beta = score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW
+        else:
+            alpha, beta = -CHECKMATE, CHECKMATE
+        nextMove = None
+        while True:
+            followPV = True
+            iterationStart = time.perf_counter()
+            iterationNodes = nodesSearched
+            score = negaMaxAB(gs, validMoves, depth, alpha, beta, turnMultiplier)
+            if statistics is not None:
+                statistics["iterations"].append({"depth": depth, "completed": not stopSearch, "seconds": time.perf_counter() - iterationStart, "nodes": nodesSearched - iterationNodes,
+                                                 "window": [alpha, beta]})
+            if stopSearch:
+                break
+            if score <= alpha and alpha > -CHECKMATE: #Failed low, the real score is somewhere below.
+                alpha = -CHECKMATE
+            elif score >= beta and beta < CHECKMATE:
+                beta = CHECKMATE
+            else:
+                break
+        if stopSearch:
+            if nextMove is not None:
+                bestMove = nextMove #Every root move that set nextMove was searched completely, so it beat the last iteration's choice.
+            break
+        if nextMove is not None:
+            bestMove = nextMove
+        previousPV = pvTable[0][:pvLength[0]]
+        if reportIteration is not None:
+            reportIteration(depth, score, nodesSearched, time.perf_counter() - startTime, previousPV)
+        if abs(score) >= MATE_SCORE and CHECKMATE - abs(score) <= depth:
+            break #A forced mate within the iteration's depth was found, deeper iterations cannot change the result.
+        if deadline is not None and time.perf_counter() - startTime > (deadline - startTime) / 2:
+            break #The next iteration takes several times longer than this one, it would not finish.
+    if bestMove is None:
+        bestMove = validMoves[0] #Not even the first iteration finished, any legal move beats none.
+    return bestMove
+
+#Search statistics. While COLLECT_STATISTICS is on, the gameState's move generation, make/unmake and evaluation methods and the transposition table's probe
+#are shadowed on the instances by counting, timing wrappers for the length of one search. With it off nothing is wrapped, so the search runs exactly as before.
+
+STATISTICS_TIMERS = {"getValidMoves": "moveGeneration", "getCaptureMoves": "moveGeneration", "getQuietMoves": "moveGeneration", "getMoveFromID": "moveGeneration",
+                     "makeMove": "makeUnmake", "undoMove": "makeUnmake", "getEvaluation": "evaluation"}
+
+def startStatistics(gs):
+    searchStatistics = {"nodes": 0, "leafEvaluations": 0, "betaCutoffs": 0, "firstMoveCutoffs": 0, "firstMoveCutoffRate": None, "ttProbes": 0, "ttHits": 0, "ttHitRate": None,
+                        "seconds": {"total": 0.0, "moveGeneration": 0.0, "makeUnmake": 0.0, "evaluation": 0.0}, "calls": {name: 0 for name in STATISTICS_TIMERS},
+                        "iterations": [], "startTime": time.perf_counter()}
+    active = {category: False for category in STATISTICS_TIMERS.values()}
+    for name, category in STATISTICS_TIMERS.items():
+        setattr(gs, name, timeCalls(getattr(gs, name), name, category, searchStatistics, active))
+    return searchStatistics
+
+#Wraps a bound method so its calls are counted and its time is added to 'category'. Calls made from inside another call of the same category
+#(the mailbox getCaptureMoves runs getValidMoves) are left to the outer one, so no time is counted twice.
+
+def timeCalls(method, name, category, searchStatistics, active):
+    seconds = searchStatistics["seconds"]
+    calls = searchStatistics["calls"]
+
+    def timed(*args):
+        if active[category]:
+            return method(*args)
+        active[category] = True
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            seconds[category] += time.perf_counter() - start
+            calls[name] += 1
+            active[category] = False
+
+    return timed
+
+def countProbes(probe):
+    def counted(key):
+        entry = probe(key)
+        statistics["ttProbes"] += 1
+        if entry is not None:
+            statistics["ttHits"] += 1
+        return entry
+    return counted
+
+#Takes the wrappers off again and fills in the totals and rates.
+
+def finishStatistics(gs):
+    for name in STATISTICS_TIMERS:
+        gs.__dict__.pop(name, None)
+    if table is not None:
+        table.__dict__.pop("probe", None)
+    statistics["nodes"] = nodesSearched
+    statistics["leafEvaluations"] = statistics["calls"]["getEvaluation"]
+    statistics["seconds"]["total"] = time.perf_counter() - statistics.pop("startTime")
+    if statistics["betaCutoffs"] > 0:
+        statistics["firstMoveCutoffRate"] = statistics["firstMoveCutoffs"] / statistics["betaCutoffs"]
+    if statistics["ttProbes"] > 0:
+        statistics["ttHitRate"] = statistics["ttHits"] / statistics["ttProbes"]
+
+#The last search's statistics as JSON, also written to 'path' if given. "null" when they were not collected.
+
+def dumpStatistics(path = None):
+    text = json.dumps(statistics, indent = 2)
+    if path is not None:
+        with open(path, "w") as statisticsFile:
+            statisticsFile.write(text + "\n")
+    return text
+
+#Returns a weighted random move from the opening book, or None when out of book or there is no book.
+
+def getBookMove(gs):
+    global book
+    if book is None:
+        try:
+            book = chessBook.polyglotBook(chessBook.BOOK_PATH)
+        except OSError:
+            book = False
+    if not book:
+        return None
+    return book.getBookMove(gs)
+
+#Endgame table value of the position for the side to move (see chessTablebase), or None when it is not in a table.
+
+def probeTablebase(gs):
+    global tablebases
+    if gs.material["w"] + gs.material["b"] > TABLEBASE_MATERIAL:
+        return None
+    if tablebases is None:
+        tablebases = chessTablebase.tablebaseSet(chessTablebase.TABLEBASE_DIR)
+        if not tablebases.available:
+            tablebases = False
+    if not tablebases:
+        return None
+    return tablebases.probe(gs)
+
+#Search score of a table value found 'ply' plies below the root. Table mates score the same as a searched mate 'ply' + 'value' plies below the root.
+
+def tablebaseScore(value, ply):
+    if value == chessTablebase.DRAW:
+        return STALEMATE
+    if value < chessTablebase.LOSS:
+        return CHECKMATE - ply - value
+    return -(CHECKMATE - ply - (value - chessTablebase.LOSS))
+
+#Mate scores count plies from the root, the transposition table keeps them counted from the stored position so an entry is right at any ply.
+
+def scoreToTable(score, ply):
+    if score >= MATE_SCORE:
+        return score + ply
+    if score <= -MATE_SCORE:
+        return score - ply
+    return score
+
+def scoreFromTable(score, ply):
+    if score >= MATE_SCORE:
+        return score - ply
+    if score <= -MATE_SCORE:
+        return score + ply
+    return score
+
+#Picks the root move from the endgame tables: the fastest mate when winning, a drawing move when drawn, the slowest mate when losing.
+#Returns None when the position or one of its replies is not in a table.
+
+def getTablebaseMove(gs, validMoves):
+    if probeTablebase(gs) is None:
+        return None
+    bestMove = None
+    bestScore = -CHECKMATE
+    for move in validMoves:
+        gs.makeMove(move)
+        value = probeTablebase(gs)
+        gs.undoMove()
+        if value is None:
+            return None
+        score = -tablebaseScore(value, 1)
+        if bestMove is None or score > bestScore:
+            bestMove = move
+            bestScore = score
+    return bestMove
+
+#Resets the killer moves and ages the history table before a new search.
+
+def clearMoveOrdering():
+    for slots in killers:
+        slots[0] = slots[1] = None
+    for squares in history.values():
+        for i in range(64):
+            squares[i] //= 2
+
+#Sorts moves for alpha-beta: principal variation move, hash move, captures by most valuable victim/least valuable attacker, promotions, killers, then quiet moves by history.
+
+def orderMoves(validMoves, ply, hashMoveID = None, pvMoveID = None):
+    killerMoves = killers[ply] if ply < len(killers) else (None, None)
+
+    def moveOrderScore(move):
+        if move.moveID == pvMoveID:
+            return PV_MOVE_SCORE
+        if move.moveID == hashMoveID:
+            return HASH_MOVE_SCORE
+        if move.pieceCaptured != "--":
+            return CAPTURE_SCORE + 10 * pointsOfMaterial[move.pieceCaptured[1]] - pointsOfMaterial[move.pieceMoved[1]]
+        if move.pawnPromotion:
+            return PROMOTION_SCORE + pointsOfMaterial[move.promotionChoice]
+        if move.moveID == killerMoves[0]:
+            return KILLER_SCORE
+        if move.moveID == killerMoves[1]:
+            return KILLER_SCORE - 1
+        return history[move.pieceMoved][move.endRow * 8 + move.endCol]
+
+    return sorted(validMoves, key = moveOrderScore, reverse = True)
+
+#Yields the legal moves of a node in stages, so a beta cutoff on an early move skips generating the rest: the PV and hash moves, captures and promotions by MVV-LVA, the killers, then the other quiet moves by history.
+#Each stage comes from one of the gameState's legal generators, so pins and Checks are handled as in getValidMoves. The caller must have undone its last move before asking for the next one.
+
+def stagedMoves(gs, ply, hashMoveID = None, pvMoveID = None):
+    searched = [] #Move IDs already yielded by an earlier stage.
+    for moveID in (pvMoveID, hashMoveID):
+        if moveID is not None and moveID not in searched:
+            move = gs.getMoveFromID(moveID)
+            if move is not None:
+                searched.append(moveID)
+                yield move
+    for move in orderMoves(gs.getCaptureMoves(), ply):
+        if move.moveID not in searched:
+            yield move
+    killerMoves = killers[ply] if ply < len(killers) else (None, None)
+    for moveID in killerMoves:
+        if moveID is not None and moveID not in searched:
+            move = gs.getMoveFromID(moveID)
+            if move is not None and move.pieceCaptured == "--" and not move.pawnPromotion: #The same squares may hold a capture here, that was searched already.
+                searched.append(moveID)
+                yield move
+    for move in orderMoves(gs.getQuietMoves(), ply):
+        if move.moveID not in searched:
+            yield move
+
+#Remembers a quiet move that caused a beta cutoff: as a killer for this ply and in the history table, weighted by depth.
+
+def updateMoveOrdering(move, ply, depth):
+    if move.pieceCaptured != "--" or move.pawnPromotion:
+        return #Captures and promotions are already ordered by MVV-LVA.
+    if ply < len(killers):
+        slots = killers[ply]
+        if slots[0] != move.moveID:
+            slots[1] = slots[0]
+            slots[0] = move.moveID
+    squares = history[move.pieceMoved]
+    square = move.endRow * 8 + move.endCol
+    squares[square] += depth * depth
+    if squares[square] > HISTORY_MAX:
+        for squares in history.values():
+            for i in range(64):
+                squares[i] //= 2
+
+#Checks the time and node budget every CHECK_EVERY nodes.
+
+def checkBudget():
+    global stopSearch
+    if searchNodeLimit is not None and nodesSearched >= searchNodeLimit:
+        stopSearch = True
+    elif deadline is not None and time.perf_counter() >= deadline:
+        stopSearch = True
+    elif stopRequest is not None and stopRequest():
+        stopSearch = True
 
 #Recursive MinMax Algorithm.
 
@@ -102,27 +592,211 @@ def negaMax(gs, validMoves, depth, turnMultiplier):
         gs.undoMove()
     return maxScore
 
-#NegaMax Algorithm + Alpha Beta Pruning.
+#NegaMax Algorithm + Alpha Beta Pruning + Transposition table. Leaves hand over to quiescence search.
+#Only the root passes validMoves, every other node gets None and pulls its moves from stagedMoves. Checkmate/stalemate is only looked for once a node turns out to have no moves.
+#Every move that raises alpha copies its child's line from pvTable into this node's row, so after the search row 0 is the principal variation.
 
-def negaMaxAB(gs, validMoves, depth, alpha, beta, turnMultiplier):
-    global nextMove
+def negaMaxAB(gs, validMoves, depth, alpha, beta, turnMultiplier, allowNullMove = True):
+    global nextMove, nodesSearched, followPV
+    ply = len(gs.zobristKeyLog) - rootPly
+    pvLength[ply] = ply
+    if depth != rootDepth and (gs.isRepetition() or gs.isFiftyMoveDraw()):
+        return STALEMATE #Either side can make it a draw from here, nothing below this node needs searching.
     if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
-    
+        return quiescence(gs, alpha, beta, turnMultiplier)
+    nodesSearched += 1
+    if nodesSearched % CHECK_EVERY == 0:
+        checkBudget()
+    if stopSearch:
+        return 0
+
+    #Endgame table lookup, the exact result replaces the search below this node.
+
+    if USE_TABLEBASES and depth != rootDepth:
+        value = probeTablebase(gs)
+        if value is not None:
+            return tablebaseScore(value, ply)
+
+    #Transposition table lookup. A deep enough entry can end the search here, otherwise its best move is searched first.
+    #With PRINCIPAL_VARIATION_SEARCH on, nodes with an open window are on the principal variation and are not cut either, the cut would leave their line out of pvTable.
+
+    alphaOriginal = alpha
+    hashMoveID = None
+    entry = table.probe(gs.zobristKey)
+    if entry is not None:
+        entryDepth, entryFlag, entryScore, hashMoveID = entry
+        entryScore = scoreFromTable(entryScore, ply)
+        if entryDepth >= depth and depth != rootDepth and (beta - alpha == 1 or not PRINCIPAL_VARIATION_SEARCH): #Never cut at the root, it still has to pick nextMove.
+            if entryFlag == EXACT:
+                return entryScore
+            elif entryFlag == LOWER_BOUND:
+                alpha = max(alpha, entryScore)
+            else:
+                beta = min(beta, entryScore)
+            if alpha >= beta:
+                return entryScore
+
+    #Null-move pruning. If the side to move is still above beta after passing the turn and a reduced search, a real move would be too.
+    #Never two null moves in a row, never in Check, and not when beta is a mate score.
+
+    inCheck = depth >= min(NULL_MOVE_MIN_DEPTH, LMR_MIN_DEPTH) and gs.isCheck()
+    if NULL_MOVE and allowNullMove and depth >= NULL_MOVE_MIN_DEPTH and depth != rootDepth and not inCheck and abs(beta) < CHECKMATE // 2:
+        pieceMaterial = getPieceMaterial(gs)
+        if pieceMaterial > 0: #King and Pawns only is where Zugzwang is the rule.
+            onPV = followPV
+            followPV = False
+            gs.makeNullMove()
+            score = -negaMaxAB(gs, None, max(depth - 1 - NULL_MOVE_REDUCTION, 0), -beta, -beta + 1, -turnMultiplier, False)
+            gs.undoNullMove()
+            if stopSearch:
+                return 0
+            if score >= beta and pieceMaterial <= NULL_MOVE_VERIFY_MATERIAL:
+                score = negaMaxAB(gs, None, depth - NULL_MOVE_REDUCTION, beta - 1, beta, turnMultiplier, False)
+                if stopSearch:
+                    return 0
+            if score >= beta:
+                return beta
+            followPV = onPV
+            pvLength[ply] = ply #The verification search ran at this ply too.
+
+    #While on the previous iteration's principal variation, its move goes first.
+
+    pvMoveID = None
+    if followPV and ply < len(previousPV):
+        pvMoveID = previousPV[ply]
+    batchScores = None
+    if depth == 1 and BATCH_EVALUATION and chessEvaluation.np is not None: #Batching needs every child up front.
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        if len(validMoves) > 0:
+            validMoves = orderMoves(validMoves, ply, hashMoveID, pvMoveID)
+            batchScores = scoreChildrenBatched(gs, validMoves, turnMultiplier)
+    if validMoves is None:
+        moves = stagedMoves(gs, ply, hashMoveID, pvMoveID)
+    else:
+        moves = orderMoves(validMoves, ply, hashMoveID, pvMoveID)
+
     maxScore = -CHECKMATE
-    for move in validMoves:
+    bestMove = None
+    movesSearched = 0
+    for i, move in enumerate(moves):
+        movesSearched += 1
+        if batchScores is not None:
+            score = int(batchScores[i])
+            if score > maxScore:
+                maxScore = score
+                bestMove = move
+                pvTable[ply][ply] = move.moveID
+                pvLength[ply] = ply + 1
+                if depth == rootDepth:
+                    nextMove = move
+            continue
         gs.makeMove(move)
-        nextMoves = gs.getValidMoves()
-        score = -negaMaxAB(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
+        followPV = pvMoveID is not None and move.moveID == pvMoveID
+        if (LATE_MOVE_REDUCTIONS and depth >= LMR_MIN_DEPTH and movesSearched > LMR_FULL_MOVES and not inCheck and not move.isCapture and not move.pawnPromotion and
+                not gs.isCheck()): #Late quiet move that gives no Check.
+            reduction = LMR_REDUCTION
+        else:
+            reduction = 0
+        if movesSearched == 1 or not (PRINCIPAL_VARIATION_SEARCH or reduction):
+            score = -negaMaxAB(gs, None, depth - 1, -beta, -alpha, -turnMultiplier)
+        else:
+            score = -negaMaxAB(gs, None, depth - 1 - reduction, -alpha - 1, -alpha, -turnMultiplier) #Null window, only asks whether the move beats alpha.
+            if score > alpha and reduction and PRINCIPAL_VARIATION_SEARCH and not stopSearch: #The reduced search failed high, ask again at full depth.
+                score = -negaMaxAB(gs, None, depth - 1, -alpha - 1, -alpha, -turnMultiplier)
+            if score > alpha and (score < beta or not PRINCIPAL_VARIATION_SEARCH) and not stopSearch: #It does, search it again with the full window for its exact score.
+                score = -negaMaxAB(gs, None, depth - 1, -beta, -alpha, -turnMultiplier)
+        gs.undoMove()
+        if stopSearch:
+            return 0 #Result of an unfinished search, discarded by the caller.
         if score > maxScore:
             maxScore = score
-            if depth == DEPTH:
+            bestMove = move
+            if depth == rootDepth and score > alpha: #Under an aspiration window a root move at or below alpha is only known to be no better.
                 nextMove = move
-        gs.undoMove()
         if maxScore > alpha: #Pruning begins.
             alpha = maxScore
+            pvTable[ply][ply] = move.moveID
+            childLength = pvLength[ply + 1]
+            pvTable[ply][ply + 1:childLength] = pvTable[ply + 1][ply + 1:childLength]
+            pvLength[ply] = childLength
         if alpha >= beta:
+            updateMoveOrdering(move, ply, depth)
+            if statistics is not None:
+                statistics["betaCutoffs"] += 1
+                if movesSearched == 1:
+                    statistics["firstMoveCutoffs"] += 1
             break #This is when we stop looking. We have already found that this score is impossible to beat.
+
+    if movesSearched == 0:
+        return -CHECKMATE + ply if gs.isCheck() else STALEMATE
+
+    if maxScore <= alphaOriginal:
+        flag = UPPER_BOUND
+    elif maxScore >= beta:
+        flag = LOWER_BOUND
+    else:
+        flag = EXACT
+    table.store(gs.zobristKey, depth, flag, scoreToTable(maxScore, ply), bestMove.moveID if bestMove is not None else None)
+    return maxScore
+
+#Material of the side to move's Knights, Bishops, Rooks and Queens, Pawns and King left out.
+
+def getPieceMaterial(gs):
+    color = "w" if gs.whiteToMove else "b"
+    material = 0
+    for row in gs.board:
+        for piece in row:
+            if piece[0] == color and piece[1] != "P":
+                material += chessEvaluation.PIECE_VALUES[piece[1]]
+    return material
+
+#Scores every child of a frontier node in one vectorized pass. The children are encoded by patching the parent's board encoding, so no move is made or undone.
+#Returns the scores from the point of view of the side to move, as -negaMaxAB of each child would.
+
+def scoreChildrenBatched(gs, validMoves, turnMultiplier):
+    global nodesSearched
+    nodesSearched += len(validMoves)
+    children = chessEvaluation.encodeChildren(chessEvaluation.encodeBoard(gs.board), validMoves)
+    return turnMultiplier * chessEvaluation.scorePositions(children)
+
+#Quiescence search. Keeps searching captures and promotions past the depth limit until the position is quiet, so a leaf is never scored in the middle of an exchange.
+#The side to move may "stand pat" on the static score instead of capturing, except in Check, where every evasion is searched (and Checkmate is found).
+
+def quiescence(gs, alpha, beta, turnMultiplier):
+    global nodesSearched
+    nodesSearched += 1
+    if nodesSearched % CHECK_EVERY == 0:
+        checkBudget()
+    if stopSearch:
+        return 0
+    inCheck = gs.isCheck() #Not gs.inCheck, that is only set by move generation.
+    if inCheck:
+        moves = gs.getValidMoves() #Every evasion.
+        if len(moves) == 0:
+            return -CHECKMATE + len(gs.zobristKeyLog) - rootPly
+        maxScore = -CHECKMATE
+    else:
+        moves = gs.getCaptureMoves()
+        maxScore = turnMultiplier * gs.getEvaluation() #Stand pat. Not scoreBoard, its checkmate/stalemate flags are not kept up to date during the search.
+        if maxScore >= beta:
+            return maxScore
+        if maxScore > alpha:
+            alpha = maxScore
+    for move in orderMoves(moves, len(killers)):
+        if move.pawnPromotion and move.promotionChoice != "Q" and move.pieceCaptured == "--" and not inCheck:
+            continue #Quiet underpromotions never help a capture sequence.
+        gs.makeMove(move)
+        score = -quiescence(gs, -beta, -alpha, -turnMultiplier)
+        gs.undoMove()
+        if stopSearch:
+            return 0
+        if score > maxScore:
+            maxScore = score
+        if maxScore > alpha:
+            alpha = maxScore
+        if alpha >= beta:
+            break
     return maxScore
 
 #Gives the current position a score in terms of material. NOT USED.
@@ -137,7 +811,8 @@ def scoreMaterial(board):
                 score -= pointsOfMaterial[square[1]]
     return score
 
-#Scores the current position based on more factors than just material present on the board (King safety, Pins, Checks, Piece Activity...)
+#Scores the current position in centipawns from White's point of view: material plus piece-square bonuses (see chessEvaluation).
+#Both are running totals kept by gameState.makeMove/undoMove, so this is a constant time read instead of a scan of all 64 squares.
 
 def scoreBoard(gs):
     if gs.checkmate:
@@ -148,11 +823,4 @@ def scoreBoard(gs):
     elif gs.stalemate:
         return STALEMATE #Neither side wins.
     
-    score = 0
-    for row in gs.board:
-        for square in row:
-            if square[0] == "w":
-                score += pointsOfMaterial[square[1]]
-            elif square[0] == "b":
-                score -= pointsOfMaterial[square[1]]
-    return score
\ No newline at end of file
+    return gs.getEvaluation()
@@ -0,0 +1,167 @@
+# Headless EPD test-suite runner. Streams an EPD file, searches every position with chessBot under a fixed time or node limit on a pool of processes,
+#and reports the solve rate, nodes, nodes/sec and the time spent on each position, so search changes can be checked for strength and speed.
+#Results are appended to a CSV file as they come in, running again with the same file skips the positions already in it.
+#Usage: python chessEPD.py suite.epd [--time 1.0 | --nodes 20000] [--workers 4] [--results results.csv]
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+import chessEngineSmart
+import chessBot
+from chessEngineSmart import Move
+
+RESULT_FIELDS = ["index", "id", "solved", "move", "expected", "depth", "nodes", "seconds"]
+
+#Splits one EPD line into its FEN (the 4 position fields) and its operations {opcode: [operands]}, e.g. {"bm": ["Nf3"], "id": ["WAC.001"]}.
+
+def parseEPD(line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("EPD needs 4 position fields: " + line)
+    fen = " ".join(fields[:4])
+    operations = {}
+    for operation in (fields[4] if len(fields) > 4 else "").split(";"):
+        parts = operation.split()
+        if parts:
+            operations[parts[0]] = [operand.strip('"') for operand in parts[1:]]
+    return fen, operations
+
+#Yields (index, fen, operations) for each position in the file, one line at a time.
+
+def readEPD(path):
+    with open(path) as epdFile:
+        index = 0
+        for line in epdFile:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                fen, operations = parseEPD(line)
+                yield index, fen, operations
+                index += 1
+
+#Finds the legal move written in standard algebraic notation ("Nf3", "exd5", "e8=Q+", "O-O") or long algebraic notation ("g1f3"). Returns None if it matches no legal move, or more than one.
+
+def getMoveFromSAN(validMoves, san):
+    san = san.rstrip("+#!?")
+    for move in validMoves:
+        if move.getUCINotation() == san:
+            return move
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        kingSide = len(san) == 3
+        for move in validMoves:
+            if move.castleMove and (move.endCol == 6) == kingSide:
+                return move
+        return None
+    promotion = "Q"
+    if "=" in san:
+        san, promotion = san.split("=")
+    elif len(san) > 2 and san[-1] in "QRBN" and san[-2].isdigit():
+        san, promotion = san[:-1], san[-1]
+    piece = san[0] if san[0] in "KQRBN" else "P"
+    squares = (san[1:] if piece != "P" else san).replace("x", "")
+    if len(squares) < 2 or squares[-2] not in Move.filesToCols or squares[-1] not in Move.ranksToRows:
+        return None
+    endRow, endCol = Move.ranksToRows[squares[-1]], Move.filesToCols[squares[-2]]
+    candidates = []
+    for move in validMoves:
+        if move.pieceMoved[1] != piece or move.endRow != endRow or move.endCol != endCol:
+            continue
+        if move.pawnPromotion and move.promotionChoice != promotion[0].upper():
+            continue
+        if all((char in Move.filesToCols and Move.filesToCols[char] == move.startCol) or (char in Move.ranksToRows and Move.ranksToRows[char] == move.startRow) for char in squares[:-2]):
+            candidates.append(move)
+    return candidates[0] if len(candidates) == 1 else None
+
+#Searches one position. Runs in the pool processes, the transposition table is cleared first so every position is searched the same way whatever ran before it.
+
+def solvePosition(task):
+    index, fen, operations, timeLimit, nodeLimit, backend = task
+    gs = chessEngineSmart.newGameState(backend)
+    gs.loadFEN(fen)
+    validMoves = gs.getValidMoves()
+    bestMoves = [move for move in (getMoveFromSAN(validMoves, san) for san in operations.get("bm", [])) if move is not None]
+    avoidMoves = [move for move in (getMoveFromSAN(validMoves, san) for san in operations.get("am", [])) if move is not None]
+    if chessBot.table is not None:
+        chessBot.table.clear()
+    depthReached = [0]
+
+    def reportIteration(depth, score, nodes, seconds, pv):
+        depthReached[0] = depth
+
+    start = time.perf_counter()
+    move = chessBot.iterativeDeepening(gs, list(validMoves), timeLimit, nodeLimit, chessBot.MAX_DEPTH, reportIteration)
+    elapsed = time.perf_counter() - start
+    legal = move is not None and move in validMoves #No move, or one the position does not allow, never solves anything.
+    if bestMoves:
+        solved = legal and move in bestMoves and move not in avoidMoves
+    else:
+        solved = legal and len(avoidMoves) > 0 and move not in avoidMoves
+    expected = " ".join(["bm " + move.getUCINotation() for move in bestMoves] + ["am " + move.getUCINotation() for move in avoidMoves])
+    return {"index": index, "id": " ".join(operations.get("id", [])), "solved": int(solved), "move": move.getUCINotation() if move is not None else "",
+            "expected": expected, "depth": depthReached[0], "nodes": chessBot.nodesSearched, "seconds": format(elapsed, ".3f")}
+
+#Reads the results already written by an earlier run, keyed by position index.
+
+def loadResults(path):
+    results = {}
+    if path is not None and os.path.exists(path):
+        with open(path, newline = "") as resultsFile:
+            for row in csv.DictReader(resultsFile):
+                results[int(row["index"])] = row
+    return results
+
+#Runs every position of the EPD file not already in 'resultsPath'. Returns the results of all positions, old and new.
+
+def runSuite(epdPath, timeLimit = 1.0, nodeLimit = None, workers = None, resultsPath = None, backend = "bitboard"):
+    results = loadResults(resultsPath)
+    tasks = ((index, fen, operations, timeLimit, nodeLimit, backend) for index, fen, operations in readEPD(epdPath) if index not in results)
+    resultsFile = None
+    if resultsPath is not None:
+        newFile = not os.path.exists(resultsPath) or os.path.getsize(resultsPath) == 0
+        resultsFile = open(resultsPath, "a", newline = "")
+        writer = csv.DictWriter(resultsFile, fieldnames = RESULT_FIELDS)
+        if newFile:
+            writer.writeheader()
+    if results:
+        print("Resuming, " + str(len(results)) + " positions already done.")
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in pool.imap_unordered(solvePosition, tasks):
+            results[result["index"]] = result
+            if resultsFile is not None:
+                writer.writerow(result)
+                resultsFile.flush()
+            print(("SOLVED " if result["solved"] else "FAILED ") + format(result["index"], "4d") + " " + result["id"] + ": " + result["move"] +
+                  " (" + result["expected"] + ") depth " + str(result["depth"]) + ", " + str(result["nodes"]) + " nodes in " + result["seconds"] + "s")
+    finally:
+        pool.close()
+        pool.join()
+        if resultsFile is not None:
+            resultsFile.close()
+    printSummary(results)
+    return results
+
+def printSummary(results):
+    solved = sum(int(result["solved"]) for result in results.values())
+    totalNodes = sum(int(result["nodes"]) for result in results.values())
+    totalTime = sum(float(result["seconds"]) for result in results.values())
+    print("Solved " + str(solved) + "/" + str(len(results)) + (" (" + format(100 * solved / len(results), ".1f") + "%)" if results else "") +
+          ", " + str(totalNodes) + " nodes in " + format(totalTime, ".3f") + "s (" + format(totalNodes / totalTime if totalTime > 0 else 0.0, ",.0f") + " nodes/sec)")
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Run an EPD test suite (bm/am opcodes) through the search.")
+    parser.add_argument("epd", help = "EPD file, one position per line")
+    parser.add_argument("--time", type = float, default = None, help = "seconds per position (default 1.0 unless --nodes is given)")
+    parser.add_argument("--nodes", type = int, default = None, help = "nodes per position")
+    parser.add_argument("--workers", type = int, default = None, help = "search processes (default: one per core)")
+    parser.add_argument("--results", default = None, help = "CSV file results are appended to, positions already in it are skipped")
+    parser.add_argument("--backend", choices = ("mailbox", "bitboard"), default = "bitboard")
+    args = parser.parse_args(argv)
+    timeLimit = args.time if args.time is not None or args.nodes is not None else 1.0
+    runSuite(args.epd, timeLimit, args.nodes, args.workers, args.results, args.backend)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
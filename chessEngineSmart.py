@@ -1,5 +1,38 @@
 # Stores all information about the current state of the chess game. Also will be responsible for determining valid moves at current GameState, and will keep a log of all played moves.
 
+import random
+from chessEvaluation import PIECE_VALUES, PIECE_SQUARE_TABLES
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+PROMOTION_PIECES = ("Q", "R", "B", "N") #Queen first, it is the default choice (the GUI always promotes to a Queen).
+
+#Zobrist keys. Every position gets a 64-bit key made by XOR-ing one random number per (piece, square), side to move, Castle right and En Passant file.
+#A fixed seed keeps keys identical between processes, so search processes can share them.
+
+zobristRandom = random.Random(20240521)
+ZOBRIST_PIECES = {color + piece: [zobristRandom.getrandbits(64) for _ in range(64)] for color in "wb" for piece in "PNBRQK"}
+ZOBRIST_BLACK_TO_MOVE = zobristRandom.getrandbits(64)
+ZOBRIST_CASTLING = [zobristRandom.getrandbits(64) for _ in range(4)] #wks, bks, wqs, bqs
+ZOBRIST_EN_PASSANT = [zobristRandom.getrandbits(64) for _ in range(8)] #One per file.
+
+#Attack tables, indexed by square row * 8 + col. The step tables list the squares a Knight/King reaches from each square, PAWN_ATTACKERS[color] the squares a Pawn of that color attacks it from,
+#and RAY_TARGETS[j][square] the squares along direction j, nearest first (the first 4 directions are orthogonal, the last 4 diagonal, the same order as pinsOrChecks).
+
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+RAY_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+
+def buildStepTargets(steps):
+    return [[(square // 8 + dRow, square % 8 + dCol) for dRow, dCol in steps if 0 <= square // 8 + dRow < 8 and 0 <= square % 8 + dCol < 8] for square in range(64)]
+
+KNIGHT_TARGETS = buildStepTargets(KNIGHT_STEPS)
+KING_TARGETS = buildStepTargets(KING_STEPS)
+PAWN_ATTACKERS = {"w": buildStepTargets(((1, -1), (1, 1))), "b": buildStepTargets(((-1, -1), (-1, 1)))} #White Pawns capture up the board, so they attack from the row below.
+RAY_TARGETS = [[[(square // 8 + dRow * i, square % 8 + dCol * i) for i in range(1, 8) if 0 <= square // 8 + dRow * i < 8 and 0 <= square % 8 + dCol * i < 8] for square in range(64)]
+               for dRow, dCol in RAY_DIRECTIONS]
+
+DEBUG_EVALUATION = False #When True, getEvaluation checks the running totals against a full recompute on every call.
+
 class gameState():
 
     def __init__(self):
@@ -62,11 +95,132 @@ class gameState():
         self.stalemate = False
         self.moveIsCastle = False
         self.moveIsCapture = False
+        self.capturesOnly = False #Set by getCaptureMoves, makes the move functions skip quiet moves.
+        self.quietsOnly = False #Set by getQuietMoves, makes the move functions skip captures and promotions.
+        self.onlySquare = None #Set by getMoveFromID, only the piece on this (row, col) gets its moves generated.
         self.enPassantPossible = () #Square where En Passant capture can occur
         self.enPassantPossibleLog = [self.enPassantPossible]
         self.currentCastlingRights = castleRights(True, True, True, True)
         self.castleRightsLog = [castleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks, 
                                              self.currentCastlingRights.wqs, self.currentCastlingRights.bqs)]
+        self.zobristKey = self.computeZobristKey()
+        self.zobristKeyLog = [self.zobristKey] #Key of every position of the game so far, for repetitions.
+        self.halfmoveClock = 0 #Plies since the last capture or Pawn move, for the fifty-move rule. Positions before it can never come back.
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.material, self.pieceSquare = self.computeEvaluationTotals() #Running totals per color ("w"/"b") in centipawns.
+
+    #Sets up the position described by a FEN string ("<pieces> <side to move> <castling> <en passant> ..."). The move log starts out empty.
+
+    def loadFEN(self, fen):
+        fields = fen.split()
+        ranks = fields[0].split("/")
+        if len(ranks) != 8:
+            raise ValueError("FEN needs 8 ranks: " + fen)
+        self.board = [["--"] * 8 for _ in range(8)]
+        for row in range(8):
+            col = 0
+            for char in ranks[row]:
+                if char.isdigit():
+                    col += int(char)
+                elif col < 8 and char.upper() in self.moveFunctions:
+                    piece = ("w" if char.isupper() else "b") + char.upper()
+                    self.board[row][col] = piece
+                    if piece == "wK":
+                        self.whiteKingLocation = (row, col)
+                    elif piece == "bK":
+                        self.blackKingLocation = (row, col)
+                    col += 1
+                else:
+                    raise ValueError("Bad FEN rank '" + ranks[row] + "': " + fen)
+            if col != 8:
+                raise ValueError("Bad FEN rank '" + ranks[row] + "': " + fen)
+        self.whiteToMove = len(fields) < 2 or fields[1] == "w"
+        castling = fields[2] if len(fields) > 2 else "-"
+        self.currentCastlingRights = castleRights("K" in castling, "k" in castling, "Q" in castling, "q" in castling)
+        self.castleRightsLog = [castleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks, 
+                                             self.currentCastlingRights.wqs, self.currentCastlingRights.bqs)]
+        if len(fields) > 3 and fields[3] != "-":
+            self.enPassantPossible = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+        else:
+            self.enPassantPossible = ()
+        self.enPassantPossibleLog = [self.enPassantPossible]
+        self.moveLog = []
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.checkmate = False
+        self.stalemate = False
+        self.moveIsCastle = False
+        self.moveIsCapture = False
+        self.zobristKey = self.computeZobristKey()
+        self.zobristKeyLog = [self.zobristKey]
+        self.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.material, self.pieceSquare = self.computeEvaluationTotals()
+
+    #Computes the Zobrist key of the current position from scratch. makeMove/undoMove keep self.zobristKey up to date incrementally, this is for setting up positions and debugging.
+
+    def computeZobristKey(self):
+        key = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    key ^= ZOBRIST_PIECES[piece][row * 8 + col]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= castlingZobristKey(self.currentCastlingRights)
+        if self.enPassantPossible:
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantPossible[1]]
+        return key
+
+    #Computes material and piece-square totals per color from scratch. makeMove/undoMove keep self.material and self.pieceSquare up to date incrementally.
+
+    def computeEvaluationTotals(self):
+        material = {"w": 0, "b": 0}
+        pieceSquare = {"w": 0, "b": 0}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    material[piece[0]] += PIECE_VALUES[piece[1]]
+                    pieceSquare[piece[0]] += PIECE_SQUARE_TABLES[piece][row * 8 + col]
+        return material, pieceSquare
+
+    #Static evaluation in centipawns from White's point of view, read straight from the running totals.
+
+    def getEvaluation(self):
+        score = self.material["w"] - self.material["b"] + self.pieceSquare["w"] - self.pieceSquare["b"]
+        if DEBUG_EVALUATION:
+            material, pieceSquare = self.computeEvaluationTotals()
+            if material != self.material or pieceSquare != self.pieceSquare:
+                raise RuntimeError("Incremental evaluation " + str((self.material, self.pieceSquare)) + " does not match recomputed " + str((material, pieceSquare)))
+        return score
+
+    #Adds (sign = 1) or takes back (sign = -1) the material and piece-square changes of a move, including the Rook of a Castle move, the Pawn taken En Passant and the promoted piece.
+
+    def updateEvaluation(self, move, sign):
+        color = move.pieceMoved[0]
+        start = move.startRow * 8 + move.startCol
+        end = move.endRow * 8 + move.endCol
+        if move.pawnPromotion:
+            placed = color + move.promotionChoice
+            self.material[color] += sign * (PIECE_VALUES[move.promotionChoice] - PIECE_VALUES["P"])
+        else:
+            placed = move.pieceMoved
+        positionDelta = PIECE_SQUARE_TABLES[placed][end] - PIECE_SQUARE_TABLES[move.pieceMoved][start]
+        if move.castleMove:
+            rookTable = PIECE_SQUARE_TABLES[color + "R"]
+            if move.endCol - move.startCol == 2: #Kingside Castle move.
+                positionDelta += rookTable[end - 1] - rookTable[end + 1]
+            else: #Queenside Castle move.
+                positionDelta += rookTable[end + 1] - rookTable[end - 2]
+        self.pieceSquare[color] += sign * positionDelta
+        if move.pieceCaptured != "--":
+            enemyColor = move.pieceCaptured[0]
+            captureSquare = move.startRow * 8 + move.endCol if move.enPassant else end
+            self.material[enemyColor] -= sign * PIECE_VALUES[move.pieceCaptured[1]]
+            self.pieceSquare[enemyColor] -= sign * PIECE_SQUARE_TABLES[move.pieceCaptured][captureSquare]
 
     #Takes a move as a parameter and executes accordingly, does not work for En Passant/Castle/Pawn Promotion
 
@@ -76,21 +230,21 @@ class gameState():
         self.moveLog.append(move) #Log move to the move log
         self.whiteToMove = not self.whiteToMove #Switch turns between Black & White
         if move.pieceMoved == 'wK': #Updates King's position
-            self.whiteKingLocation == (move.endRow, move.endCol)
+            self.whiteKingLocation = (move.endRow, move.endCol)
         elif move.pieceMoved == 'bK':
-            self.blackKingLocation == (move.endRow, move.endCol)
+            self.blackKingLocation = (move.endRow, move.endCol)
 
         #En Passant, Pawn Promotion, & Castling
 
         if move.pieceMoved[1] == 'P' and abs(move.startRow - move.endRow) == 2:
-            self.enPassantPossible = ((move.endRow + move.startRow) / 2, move.endCol)
+            self.enPassantPossible = ((move.endRow + move.startRow) // 2, move.endCol)
         else:
             self.enPassantPossible = ()
         if move.enPassant:
             self.board[move.startRow][move.endCol] = "--"
         if move.pawnPromotion:
             #print("Pawn promotion!") #FOR DEBUGGING
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + "Q"
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice
         if move.castleMove:
             if move.endCol - move.startCol == 2: #Kingside Castle move.
                 self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1] #Moves Rook to new Square.
@@ -111,6 +265,31 @@ class gameState():
         else:
             self.moveIsCapture = False
 
+        #Zobrist key. Only the squares, rights and En Passant file this move changed are XOR-ed in/out.
+
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE
+        start = move.startRow * 8 + move.startCol
+        end = move.endRow * 8 + move.endCol
+        key ^= ZOBRIST_PIECES[move.pieceMoved][start] ^ ZOBRIST_PIECES[self.board[move.endRow][move.endCol]][end]
+        if move.pieceCaptured != "--":
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.startRow * 8 + move.endCol if move.enPassant else end]
+        if move.castleMove:
+            rookKeys = ZOBRIST_PIECES[move.pieceMoved[0] + "R"]
+            if move.endCol - move.startCol == 2: #Kingside Castle move.
+                key ^= rookKeys[end + 1] ^ rookKeys[end - 1]
+            else: #Queenside Castle move.
+                key ^= rookKeys[end - 2] ^ rookKeys[end + 1]
+        key ^= castlingZobristKey(self.castleRightsLog[-2]) ^ castlingZobristKey(self.currentCastlingRights)
+        if self.enPassantPossibleLog[-2]:
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantPossibleLog[-2][1]]
+        if self.enPassantPossible:
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantPossible[1]]
+        self.zobristKey = key
+        self.zobristKeyLog.append(key)
+        self.halfmoveClock = 0 if move.pieceMoved[1] == "P" or move.pieceCaptured != "--" else self.halfmoveClock + 1
+        self.halfmoveClockLog.append(self.halfmoveClock)
+        self.updateEvaluation(move, 1)
+
     #Undo last move
 
     def undoMove(self):
@@ -120,9 +299,9 @@ class gameState():
             self.board[move.endRow][move.endCol] = move.pieceCaptured
             self.whiteToMove = not self.whiteToMove
             if move.pieceMoved == 'wK': #Reverts King's position
-                self.whiteKingLocation == (move.startRow, move.startCol)
+                self.whiteKingLocation = (move.startRow, move.startCol)
             elif move.pieceMoved == 'bK':
-                self.blackKingLocation == (move.startRow, move.startCol)
+                self.blackKingLocation = (move.startRow, move.startCol)
             
             #En Passant.
 
@@ -135,7 +314,8 @@ class gameState():
             #Castling.
 
             self.castleRightsLog.pop() #Remove the new Castle rights from the move we are undoing.
-            self.currentCastlingRights = self.castleRightsLog[-1] #Set the current Castle rights to the last one in the list.
+            lastRights = self.castleRightsLog[-1] #Copy the last Castle rights in the list, updateCastleRights mutates the current object in place.
+            self.currentCastlingRights = castleRights(lastRights.wks, lastRights.bks, lastRights.wqs, lastRights.bqs)
             if move.castleMove:
                 if move.endCol - move.startCol == 2: #Kingside Castle move.
                     self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
@@ -143,10 +323,60 @@ class gameState():
                 else: #Queenside Castle move.
                     self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
                     self.board[move.endRow][move.endCol + 1] = "--"
-                    
+
+            self.zobristKeyLog.pop()
+            self.zobristKey = self.zobristKeyLog[-1]
+            self.halfmoveClockLog.pop()
+            self.halfmoveClock = self.halfmoveClockLog[-1]
+            self.updateEvaluation(move, -1)
             self.checkmate = False #Undoes a Checkmate.
             self.stalemate = False #Undoes a Stalemate.
 
+    #Passes the turn without moving, for null-move pruning in the search. undoNullMove takes it back. Not a legal chess move, only the search uses it.
+    #The halfmove clock restarts so no repetition is looked for across it, and the moveLog is left alone.
+
+    def makeNullMove(self):
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE
+        if self.enPassantPossible:
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantPossible[1]]
+        self.whiteToMove = not self.whiteToMove
+        self.enPassantPossible = ()
+        self.enPassantPossibleLog.append(self.enPassantPossible)
+        self.zobristKey = key
+        self.zobristKeyLog.append(key)
+        self.halfmoveClock = 0
+        self.halfmoveClockLog.append(self.halfmoveClock)
+
+    def undoNullMove(self):
+        self.whiteToMove = not self.whiteToMove
+        self.enPassantPossibleLog.pop()
+        self.enPassantPossible = self.enPassantPossibleLog[-1]
+        self.zobristKeyLog.pop()
+        self.zobristKey = self.zobristKeyLog[-1]
+        self.halfmoveClockLog.pop()
+        self.halfmoveClock = self.halfmoveClockLog[-1]
+
+    #True if the current position has now occurred 'times' times. Only positions with the same side to move since the last capture or Pawn move are compared,
+    #the ones before it cannot repeat. The search counts the first repetition as a draw, the game needs the third.
+
+    def isRepetition(self, times = 2):
+        if self.halfmoveClock < 4: #A position needs at least 4 plies to come back.
+            return False
+        keys = self.zobristKeyLog
+        key = self.zobristKey
+        seen = 1
+        for i in range(len(keys) - 5, max(len(keys) - 2 - self.halfmoveClock, -1), -2):
+            if keys[i] == key:
+                seen += 1
+                if seen >= times:
+                    return True
+        return False
+
+    #True once 50 moves by each side have passed without a capture or Pawn move.
+
+    def isFiftyMoveDraw(self):
+        return self.halfmoveClock >= 100
+
     #Updates Castling rights.
 
     def updateCastleRights(self, move):
@@ -212,17 +442,23 @@ class gameState():
                             break
                 for i in range(len(moves) - 1, -1, -1): #Removes illegal moves traversing the list in reverse
                     if moves[i].pieceMoved[1] != 'K': #Must block or capture
+                        if moves[i].enPassant and (moves[i].startRow, moves[i].endCol) == (checkRow, checkCol):
+                            continue #En Passant captures the checking Pawn without landing on its square.
                         if not (moves[i].endRow, moves[i].endCol) in validSquares: #Move does not address the Check
                             moves.remove(moves[i])
             else: #If the king is being attacked by 2 different pieces simoultaneously, the King must move
                 self.getKingMoves(kingRow, kingCol, moves)
         else: #King is not in check, all moves are legal
             moves = self.getAllPossibleMoves()
-            if self.whiteToMove:
-                self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
-            else:
-                self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
+            if not self.capturesOnly: #Castling is never a capture.
+                if self.whiteToMove:
+                    self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
+                else:
+                    self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
 
+        if self.capturesOnly or self.quietsOnly or self.onlySquare is not None: #Only part of the moves were generated, leave checkmate/stalemate alone.
+            self.currentCastlingRights = tempCastleRights
+            return moves
         if len(moves) == 0:
             if self.inCheck:
                 self.checkmate = True
@@ -234,6 +470,33 @@ class gameState():
         self.currentCastlingRights = tempCastleRights
         return moves
 
+    #Gets only the legal captures and promotions (En Passant included), without building the quiet moves. Used by quiescence search.
+
+    def getCaptureMoves(self):
+        self.capturesOnly = True
+        moves = self.getValidMoves()
+        self.capturesOnly = False
+        return moves
+
+    #Gets only the legal moves getCaptureMoves leaves out: non-capturing, non-promoting moves and castling.
+
+    def getQuietMoves(self):
+        self.quietsOnly = True
+        moves = self.getValidMoves()
+        self.quietsOnly = False
+        return moves
+
+    #Finds the legal move with this moveID, or None if there is none. Only the piece on the start square gets its moves generated, so a hash or killer move can be checked without building the whole list.
+
+    def getMoveFromID(self, moveID):
+        self.onlySquare = (moveID // 1000 % 10, moveID // 100 % 10)
+        moves = self.getValidMoves()
+        self.onlySquare = None
+        for move in moves:
+            if move.moveID == moveID:
+                return move
+        return None
+
     #Determine if current player is in Check. Important for sound effects.
 
     def isCheck(self):
@@ -245,12 +508,34 @@ class gameState():
     #Determine if the enemy can attack the square (row, col).
 
     def squareUnderAttack(self, row, col):
-        self.whiteToMove = not self.whiteToMove #Switch to opponent's turn
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove #Switch back to current player's turn
-        for move in oppMoves:
-            if move.endRow == row and move.endCol == col: #Is square under attack?
+        return self.isSquareAttacked(row, col, "b" if self.whiteToMove else "w")
+
+    #Determine if a piece of 'attackerColor' attacks the square (row, col), by looking up the squares an attacker would have to stand on instead of generating any moves.
+
+    def isSquareAttacked(self, row, col, attackerColor):
+        board = self.board
+        square = row * 8 + col
+        knight = attackerColor + "N"
+        for endRow, endCol in KNIGHT_TARGETS[square]:
+            if board[endRow][endCol] == knight:
+                return True
+        pawn = attackerColor + "P"
+        for endRow, endCol in PAWN_ATTACKERS[attackerColor][square]:
+            if board[endRow][endCol] == pawn:
+                return True
+        king = attackerColor + "K"
+        for endRow, endCol in KING_TARGETS[square]:
+            if board[endRow][endCol] == king:
                 return True
+        queen = attackerColor + "Q"
+        for j in range(8):
+            slider = attackerColor + ("R" if j < 4 else "B")
+            for endRow, endCol in RAY_TARGETS[j][square]:
+                endPiece = board[endRow][endCol]
+                if endPiece != "--": #Only the first piece along the ray can attack the square.
+                    if endPiece == slider or endPiece == queen:
+                        return True
+                    break
         return False
 
     # Gets all moves without considering Checks
@@ -261,6 +546,8 @@ class gameState():
             for col in range(len(self.board[row])):
                 turn = self.board[row][col][0]
                 if (turn == 'w' and self.whiteToMove) or (turn == 'b' and not self.whiteToMove):
+                    if self.onlySquare is not None and self.onlySquare != (row, col):
+                        continue
                     piece = self.board[row][col][1]
                     self.moveFunctions[piece](row, col, moves) #Calls the appropriate move function based on piece type
         return moves
@@ -292,18 +579,19 @@ class gameState():
         pawnPromotion = False
 
         if self.board[row + moveAmount][col] == '--': #1-Square Pawn advance
-            if not piecePinned or pinDirection == (moveAmount, 0):
+            if not piecePinned or pinDirection == (moveAmount, 0) or pinDirection == (-moveAmount, 0): #A Pawn pinned along its file can still advance
                 if row + moveAmount == backRow: #If the Pawn gets to the back rank, there is a Pawn Promotion
                     pawnPromotion = True
-                moves.append(Move((row, col), (row + moveAmount, col), self.board, pawnPromotion = pawnPromotion))
-                if row == startRow and self.board[row + 2 * moveAmount][col] == '--': #2-Square Pawn advance
+                if (pawnPromotion and not self.quietsOnly) or not (pawnPromotion or self.capturesOnly): #A promoting push goes with the captures, any other push with the quiet moves.
+                    self.addPawnMove((row, col), (row + moveAmount, col), moves, pawnPromotion)
+                if row == startRow and self.board[row + 2 * moveAmount][col] == '--' and not self.capturesOnly: #2-Square Pawn advance
                     moves.append(Move((row, col), (row + 2 * moveAmount, col), self.board))
-        if col - 1 >= 0: #Makes sure pawn cannot capture across the board (Left Capture)
-            if not piecePinned or pinDirection == (moveAmount, -1):
+        if col - 1 >= 0 and not self.quietsOnly: #Makes sure pawn cannot capture across the board (Left Capture)
+            if not piecePinned or pinDirection == (moveAmount, -1) or pinDirection == (-moveAmount, 1):
                 if self.board[row + moveAmount][col - 1][0] == enemyColor:
                     if row + moveAmount == backRow: #If the Pawn gets to the back rank, there is a Pawn Promotion
                         pawnPromotion = True
-                    moves.append(Move((row, col), (row + moveAmount, col - 1), self.board, pawnPromotion = pawnPromotion))
+                    self.addPawnMove((row, col), (row + moveAmount, col - 1), moves, pawnPromotion)
                 if (row + moveAmount, col - 1) == self.enPassantPossible:
                     attackingPiece = blockingPiece = False
                     if kingRow == row:
@@ -320,16 +608,18 @@ class gameState():
                             square = self.board[row][j]
                             if square[0] == enemyColor and (square[1] == "R" or square[1] == "Q"):
                                 attackingPiece = True
+                                break
                             elif square != "--":
                                 blockingPiece = True
+                                break #Only the first piece behind the Pawns matters.
                     if not attackingPiece or blockingPiece:
                         moves.append(Move((row, col), (row + moveAmount, col - 1), self.board, enPassant = True))
-        if col + 1 <= 7: #Makes sure pawn cannot capture across the board (Right Capture)
-            if not piecePinned or pinDirection == (moveAmount, 1):
+        if col + 1 <= 7 and not self.quietsOnly: #Makes sure pawn cannot capture across the board (Right Capture)
+            if not piecePinned or pinDirection == (moveAmount, 1) or pinDirection == (-moveAmount, -1):
                 if self.board[row + moveAmount][col + 1][0] == enemyColor:
                     if row + moveAmount == backRow: #If the Pawn gets to the back rank, there is a Pawn Promotion
                         pawnPromotion = True
-                    moves.append(Move((row, col), (row + moveAmount, col + 1), self.board, pawnPromotion = pawnPromotion))
+                    self.addPawnMove((row, col), (row + moveAmount, col + 1), moves, pawnPromotion)
                 if (row + moveAmount, col + 1) == self.enPassantPossible:
                     attackingPiece = blockingPiece = False
                     if kingRow == row:
@@ -346,11 +636,22 @@ class gameState():
                             square = self.board[row][j]
                             if square[0] == enemyColor and (square[1] == "R" or square[1] == "Q"):
                                 attackingPiece = True
+                                break
                             elif square != "--":
                                 blockingPiece = True
+                                break #Only the first piece behind the Pawns matters.
                     if not attackingPiece or blockingPiece:
                         moves.append(Move((row, col), (row + moveAmount, col + 1), self.board, enPassant = True))
 
+    #Adds a Pawn move, or one move per promotion piece if the Pawn reaches the back rank.
+
+    def addPawnMove(self, startSq, endSq, moves, pawnPromotion = False):
+        if pawnPromotion:
+            for piece in PROMOTION_PIECES:
+                moves.append(Move(startSq, endSq, self.board, pawnPromotion = True, promotionChoice = piece))
+        else:
+            moves.append(Move(startSq, endSq, self.board))
+
     def getRookMoves(self, row, col, moves):
         piecePinned = False
         pinDirection = ()
@@ -372,9 +673,11 @@ class gameState():
                     if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
                         endPiece = self.board[endRow][endCol]
                         if endPiece == '--': #Is the space the Rook is moving to empty?
-                            moves.append(Move((row, col), (endRow, endCol), self.board))
+                            if not self.capturesOnly:
+                                moves.append(Move((row, col), (endRow, endCol), self.board))
                         elif endPiece[0] == enemyColor: #Does the space the Rook is moving to have an enemy piece on it?
-                            moves.append(Move((row, col), (endRow, endCol), self.board))
+                            if not self.quietsOnly:
+                                moves.append(Move((row, col), (endRow, endCol), self.board))
                             break
                         else: #Friendly Piece
                             break
@@ -401,9 +704,11 @@ class gameState():
                     if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
                         endPiece = self.board[endRow][endCol]
                         if endPiece == '--': #Is the space the Bishop is moving to empty?
-                            moves.append(Move((row, col), (endRow, endCol), self.board))
+                            if not self.capturesOnly:
+                                moves.append(Move((row, col), (endRow, endCol), self.board))
                         elif endPiece[0] == enemyColor: #Does the space the Bishop is moving to have an enemy piece on it?
-                            moves.append(Move((row, col), (endRow, endCol), self.board))
+                            if not self.quietsOnly:
+                                moves.append(Move((row, col), (endRow, endCol), self.board))
                             break
                         else: #Friendly Piece
                             break
@@ -426,34 +731,27 @@ class gameState():
             if 0 <= endRow < 8 and 0 <= endCol < 8: #Makes sure piece is still on the board
                 if not piecePinned:
                     endPiece = self.board[endRow][endCol]
-                    if endPiece[0] != allyColor: #Is the square the Knight is moving to empty/have an enemy piece on it?
+                    if endPiece[0] != allyColor and (endPiece != "--" or not self.capturesOnly) and (endPiece == "--" or not self.quietsOnly): #Is the square the Knight is moving to empty/have an enemy piece on it?
                         moves.append(Move((row, col), (endRow, endCol), self.board))
 
     def getQueenMoves(self, row, col, moves):
+        self.getRookMoves(row, col, moves) #Rook moves first, getRookMoves leaves a Queen's pin in the list so getBishopMoves still sees it.
         self.getBishopMoves(row, col, moves)
-        self.getRookMoves(row, col, moves)
 
     def getKingMoves(self, row, col, moves):
-        rowMoves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        colMoves = (-1, 0, 1, -1, 1, -1, 0, 1)
         allyColor = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow = row + rowMoves[i]
-            endCol = col + colMoves[i]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor: #Not an ally piece, could also be an empty square
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow, endCol)
-                    inCheck, pins, checks = self.pinsOrChecks()
-                    if not inCheck:
-                        moves.append(Move((row, col), (endRow, endCol), self.board))
-                    if allyColor == 'w': #Place the King back into its original position
-                        self.whiteKingLocation = (row, col)
-                    else:
-                        self.blackKingLocation = (row, col)
+        enemyColor = "b" if self.whiteToMove else "w"
+        king = self.board[row][col]
+        self.board[row][col] = "--" #Lift the King off the board, so it cannot hide from a slider behind its own square.
+        safeSquares = []
+        for endRow, endCol in KING_TARGETS[row * 8 + col]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] != allyColor and (endPiece != "--" or not self.capturesOnly) and (endPiece == "--" or not self.quietsOnly): #Not an ally piece, could also be an empty square
+                if not self.isSquareAttacked(endRow, endCol, enemyColor):
+                    safeSquares.append((endRow, endCol))
+        self.board[row][col] = king #Place the King back before the Moves read the board.
+        for endSquare in safeSquares:
+            moves.append(Move((row, col), endSquare, self.board))
 
     #Generates all valid Castling moves for the king at (row, col) and adds them to the list of valid moves
 
@@ -546,6 +844,30 @@ class gameState():
         #print(inCheck) VERY IMPORTANT FOR DEBUGGING
         return inCheck, pins, checks
 
+#Returns a new gameState using the requested board backend. "mailbox" is the 8x8 list above, "bitboard" keeps 64-bit piece sets (see chessBitboard). Both share the same makeMove/undoMove/getValidMoves API.
+
+def newGameState(backend = "mailbox"):
+    if backend == "mailbox":
+        return gameState()
+    if backend == "bitboard":
+        import chessBitboard #Imported here, chessBitboard imports this module.
+        return chessBitboard.bitboardGameState()
+    raise ValueError("Unknown board backend: " + str(backend))
+
+#Zobrist key contribution of a set of Castle rights.
+
+def castlingZobristKey(rights):
+    key = 0
+    if rights.wks:
+        key ^= ZOBRIST_CASTLING[0]
+    if rights.bks:
+        key ^= ZOBRIST_CASTLING[1]
+    if rights.wqs:
+        key ^= ZOBRIST_CASTLING[2]
+    if rights.bqs:
+        key ^= ZOBRIST_CASTLING[3]
+    return key
+
 class castleRights():
     def __init__(self, wks, bks, wqs, bqs):
         self.wks = wks
@@ -553,8 +875,17 @@ class castleRights():
         self.wqs = wqs
         self.bqs = bqs
 
+#Piece strings in the order of their 4-bit index in Move.pack().
+
+MOVE_PIECES = ("--", "wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK")
+MOVE_PIECE_INDEX = {piece: index for index, piece in enumerate(MOVE_PIECES)}
+
 class Move():
 
+    #Fixed attribute slots instead of a per-object __dict__. Millions of Moves are made and dropped during a search, slots make each one smaller and quicker to build.
+
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured", "enPassant", "pawnPromotion", "promotionChoice", "castleMove", "moveID")
+
     #Maps keys to values (key : value)
 
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
@@ -562,23 +893,43 @@ class Move():
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, startSq, endSq, board, enPassant = False, pawnPromotion = False, castleMove = False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
+    def __init__(self, startSq, endSq, board, enPassant = False, pawnPromotion = False, castleMove = False, promotionChoice = "Q"):
+        self.startRow = startRow = startSq[0]
+        self.startCol = startCol = startSq[1]
+        self.endRow = endRow = endSq[0]
+        self.endCol = endCol = endSq[1]
+        self.pieceMoved = board[startRow][startCol]
         self.enPassant = enPassant
         self.pawnPromotion = pawnPromotion
+        self.promotionChoice = promotionChoice
         self.castleMove = castleMove
-        self.isCapture = self.pieceCaptured != "--"
 
         if enPassant:
             self.pieceCaptured = 'bP' if self.pieceMoved == 'wP' else 'wP' #En Passant captures pawn of opposite color
+        else:
+            self.pieceCaptured = board[endRow][endCol]
+
+        self.moveID = startRow * 1000 + startCol * 100 + endRow * 10 + endCol
+        if pawnPromotion and promotionChoice != "Q":
+            self.moveID += PROMOTION_PIECES.index(promotionChoice) * 10000 #Queen promotions keep the plain ID, so a move built from two clicks matches them.
+
+    @property
+    def isCapture(self):
+        return self.pieceCaptured != "--"
 
+    #Packs the whole move into one int: start square (bits 0-5), end square (6-11), piece moved (12-15), piece captured (16-19), En Passant/promotion/Castle flags (20-22) and promotion choice (23-24).
+    #Cheap to keep in tables and lists, unpackMove turns it back into a Move.
 
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+    def pack(self):
+        packed = (self.startRow * 8 + self.startCol) | (self.endRow * 8 + self.endCol) << 6 | \
+                 MOVE_PIECE_INDEX[self.pieceMoved] << 12 | MOVE_PIECE_INDEX[self.pieceCaptured] << 16 | PROMOTION_PIECES.index(self.promotionChoice) << 23
+        if self.enPassant:
+            packed |= 1 << 20
+        if self.pawnPromotion:
+            packed |= 1 << 21
+        if self.castleMove:
+            packed |= 1 << 22
+        return packed
 
     #Overrides equals method
 
@@ -589,9 +940,9 @@ class Move():
 
     def getChessNotation(self):
         if self.pawnPromotion:
-            return self.getRankFile(self.endRow, self.endCol) + "Q"
+            return self.getRankFile(self.endRow, self.endCol) + self.promotionChoice
         if self.castleMove:
-            if self.end_col == 1:
+            if self.endCol == 2:
                 return "0-0-0"
             else:
                 return "0-0"
@@ -611,6 +962,14 @@ class Move():
 
     def getRankFile(self, row, col):
         return self.colsToFiles[col] + self.rowsToRanks[row]
+
+    #Long algebraic notation used by perft and engine protocols, e.g. "e2e4" or "e7e8q".
+
+    def getUCINotation(self):
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        if self.pawnPromotion:
+            notation += self.promotionChoice.lower()
+        return notation
     
     #Overriding the str() function
     
@@ -619,14 +978,30 @@ class Move():
             return "O-O" if self.endCol == 6 else "O-O-O"
         
         endSq = self.getRankFile(self.endRow, self.endCol)
-        if self.pieceMoved == 'P':
+        if self.pieceMoved[1] == 'P':
             if self.isCapture:
                 return self.colsToFiles[self.startCol] + "x" + endSq
             else:
-                return endSq + "Q" if self.pawnPromotion else endSq
+                return endSq + self.promotionChoice if self.pawnPromotion else endSq
             
         moveString = self.pieceMoved[1]
         if self.isCapture:
             moveString += "x"
         return moveString + endSq
-        
\ No newline at end of file
+
+#Rebuilds the Move stored by Move.pack(), without needing the board it was made on. Used wherever only packed moves are kept, e.g. to show or animate a move in the GUI.
+
+def unpackMove(packed):
+    move = Move.__new__(Move)
+    move.startRow, move.startCol = divmod(packed & 63, 8)
+    move.endRow, move.endCol = divmod(packed >> 6 & 63, 8)
+    move.pieceMoved = MOVE_PIECES[packed >> 12 & 15]
+    move.pieceCaptured = MOVE_PIECES[packed >> 16 & 15]
+    move.enPassant = bool(packed >> 20 & 1)
+    move.pawnPromotion = bool(packed >> 21 & 1)
+    move.castleMove = bool(packed >> 22 & 1)
+    move.promotionChoice = PROMOTION_PIECES[packed >> 23 & 3]
+    move.moveID = move.startRow * 1000 + move.startCol * 100 + move.endRow * 10 + move.endCol
+    if move.pawnPromotion and move.promotionChoice != "Q":
+        move.moveID += PROMOTION_PIECES.index(move.promotionChoice) * 10000
+    return move
@@ -0,0 +1,200 @@
+# Long-lived engine process. The worker keeps its own gameState, transposition table and move ordering tables from one move to the next, so the GUI only sends small messages instead of starting a process and pickling its whole gameState for every AI move.
+#Commands (GUI -> worker): ("new", fen), ("move", moveID), ("undo",), ("go", searchID, timeLimit, nodeLimit, maxDepth),
+#                          ("ponder", searchID, predictedMoveID, timeLimit, nodeLimit, maxDepth), ("quit",)
+#Results (worker -> GUI):  ("info", searchID, depth, score, nodes, seconds, pv) after every completed iteration, then ("bestmove", searchID, moveID, statistics)
+#                          statistics is chessBot's statistics dictionary when chessBot.COLLECT_STATISTICS is on in the worker, otherwise None.
+#With smpWorkers above 1 the worker searches with chessParallel's Lazy SMP, starting that many search processes of its own.
+#The worker only reads commands between searches. A running search is stopped through a shared value holding the newest cancelled searchID,
+#and a ponder search is told its predicted move was played through a second one holding the searchID of the ponder hit.
+
+import atexit
+import multiprocessing
+import queue
+import time
+import chessEngineSmart
+import chessBot
+
+PONDER_WAIT = 0.01 #Seconds between checks while a finished ponder search waits for the opponent's move.
+
+#Runs in the worker process until it gets "quit".
+
+def workerMain(commands, results, cancelledSearch, ponderHit, backend, collectStatistics = False, smpWorkers = 1):
+    chessBot.COLLECT_STATISTICS = collectStatistics
+    chessBot.SMP_WORKERS = smpWorkers
+    gs = chessEngineSmart.newGameState(backend)
+    while True:
+        command = commands.get()
+        kind = command[0]
+        if kind == "new":
+            gs.loadFEN(command[1])
+        elif kind == "move":
+            move = gs.getMoveFromID(command[1])
+            if move is not None: #Only a legal move is played, a worker out of step with the GUI must not crash on it.
+                gs.makeMove(move)
+        elif kind == "undo":
+            gs.undoMove()
+        elif kind == "go":
+            searchID, timeLimit, nodeLimit, maxDepth = command[1:]
+            if cancelledSearch.value >= searchID: #Cancelled before it started.
+                results.put(("bestmove", searchID, None, None))
+                continue
+            chessBot.stopRequest = lambda: cancelledSearch.value >= searchID
+            bestMove = runSearch(gs, results, searchID, timeLimit, nodeLimit, maxDepth)
+            results.put(("bestmove", searchID, bestMove.moveID if bestMove is not None else None, chessBot.statistics))
+        elif kind == "ponder":
+            searchID, predictedMoveID, timeLimit, nodeLimit, maxDepth = command[1:]
+            if cancelledSearch.value >= searchID:
+                results.put(("bestmove", searchID, None, None))
+                continue
+            predictedMove = gs.getMoveFromID(predictedMoveID)
+            bestMove = None
+            if predictedMove is not None:
+                gs.makeMove(predictedMove) #Search as if the opponent already played the predicted move.
+                if gs.getValidMoves(): #Nothing to ponder when the predicted move ends the game.
+                    chessBot.stopRequest = ponderStopRequest(cancelledSearch, ponderHit, searchID, time.perf_counter(), timeLimit, nodeLimit)
+                    bestMove = runSearch(gs, results, searchID, None, None, maxDepth)
+            while cancelledSearch.value < searchID and ponderHit.value != searchID: #Finished early (e.g. found a mate), hold the answer until the opponent moves.
+                time.sleep(PONDER_WAIT)
+            if ponderHit.value == searchID:
+                results.put(("bestmove", searchID, bestMove.moveID if bestMove is not None else None, chessBot.statistics))
+            else: #Ponder miss, take the predicted move back. The tables keep what was learned.
+                if predictedMove is not None:
+                    gs.undoMove()
+                results.put(("bestmove", searchID, None, None))
+        elif kind == "quit":
+            break
+
+def runSearch(gs, results, searchID, timeLimit, nodeLimit, maxDepth):
+    reportIteration = lambda depth, score, nodes, seconds, pv: results.put(("info", searchID, depth, score, nodes, seconds, pv))
+    bestMove = chessBot.iterativeDeepening(gs, gs.getValidMoves(), timeLimit, nodeLimit, maxDepth, reportIteration)
+    chessBot.stopRequest = None
+    return bestMove
+
+#Stop check for a ponder search. It runs without limits until the ponder hit, which hands it the normal budget counted from the start of pondering.
+#If the opponent took longer than that, the search stops at the next check and answers at once.
+
+def ponderStopRequest(cancelledSearch, ponderHit, searchID, ponderStart, timeLimit, nodeLimit):
+    def stopRequest():
+        if cancelledSearch.value >= searchID:
+            return True
+        if ponderHit.value == searchID and chessBot.deadline is None and chessBot.searchNodeLimit is None:
+            if timeLimit is not None:
+                chessBot.deadline = ponderStart + timeLimit
+            chessBot.searchNodeLimit = nodeLimit
+        return False
+    return stopRequest
+
+#GUI side of the worker. Mirror every move played on the board with pushMove/undoMove/newGame, start a search with go() and call poll() once per frame until it returns True.
+
+class engineWorker():
+
+    #'smpWorkers' defaults to chessBot.SMP_WORKERS. A worker that starts search processes cannot be a daemon, so close() is also registered to run at exit,
+    #or a GUI that ends without calling it would wait on the worker forever.
+
+    def __init__(self, backend = "bitboard", collectStatistics = False, smpWorkers = None):
+        if smpWorkers is None:
+            smpWorkers = chessBot.SMP_WORKERS
+        self.commands = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.cancelledSearch = multiprocessing.Value("i", 0, lock = False)
+        self.ponderHit = multiprocessing.Value("i", 0, lock = False)
+        self.searchID = 0
+        self.searching = False
+        self.pondering = False #True while the current search is on the predicted reply and the opponent has not moved yet.
+        self.ponderMoveID = None
+        self.bestMoveID = None #Move ID found by the last finished search (None if there was no move).
+        self.lastInfo = None #Newest ("info", ...) message of the current search.
+        self.statistics = None #Search statistics sent with the last bestmove (None unless the worker collects them).
+        self.process = multiprocessing.Process(target = workerMain, args = (self.commands, self.results, self.cancelledSearch, self.ponderHit, backend, collectStatistics, smpWorkers),
+                                               daemon = smpWorkers <= 1)
+        self.process.start()
+        if not self.process.daemon:
+            atexit.register(self.close)
+
+    def newGame(self, fen = chessEngineSmart.START_FEN):
+        self.stop()
+        self.commands.put(("new", fen))
+
+    #A move matching the one being pondered turns the ponder search into the real search, it keeps running and go() will not restart it.
+
+    def pushMove(self, move):
+        if self.pondering and move.moveID == self.ponderMoveID:
+            self.ponderHit.value = self.searchID
+            self.pondering = False
+            return
+        self.stop()
+        self.commands.put(("move", move.moveID))
+
+    def undoMove(self):
+        self.stop()
+        self.commands.put(("undo",))
+
+    #Starts searching the worker's current position. Returns the searchID that poll() waits for.
+
+    def go(self, timeLimit = chessBot.TIME_LIMIT, nodeLimit = chessBot.NODE_LIMIT, maxDepth = chessBot.MAX_DEPTH):
+        if self.searching and not self.pondering:
+            return self.searchID #Already searching this position after a ponder hit.
+        self.stop()
+        self.searchID += 1
+        self.searching = True
+        self.bestMoveID = None
+        self.lastInfo = None
+        self.commands.put(("go", self.searchID, timeLimit, nodeLimit, maxDepth))
+        return self.searchID
+
+    #Starts thinking on the opponent's time, after 'playedMove' was pushed: searches the reply the last search predicted (the second move of its principal variation).
+    #Returns False if there is no prediction to ponder on.
+
+    def ponder(self, playedMove, timeLimit = chessBot.TIME_LIMIT, nodeLimit = chessBot.NODE_LIMIT, maxDepth = chessBot.MAX_DEPTH):
+        if self.searching or self.lastInfo is None:
+            return False
+        pv = self.lastInfo[6]
+        if len(pv) < 2 or pv[0] != playedMove.moveID:
+            return False
+        self.searchID += 1
+        self.searching = True
+        self.pondering = True
+        self.ponderMoveID = pv[1]
+        self.bestMoveID = None
+        self.lastInfo = None
+        self.commands.put(("ponder", self.searchID, self.ponderMoveID, timeLimit, nodeLimit, maxDepth))
+        return True
+
+    #Cancels the current search, its result will be ignored. A cancelled ponder search takes its predicted move back.
+
+    def stop(self):
+        if self.searching:
+            self.cancelledSearch.value = self.searchID
+            self.searching = False
+            self.pondering = False
+
+    #Reads the results that have arrived without blocking. Returns True once the current search has finished, its move is in bestMoveID. Never True while still pondering.
+    #If the worker process has died, the search is finished with no move (bestMoveID None), so the caller is not left waiting forever.
+
+    def poll(self):
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                if self.searching and not self.pondering and not self.process.is_alive():
+                    self.searching = False
+                    self.bestMoveID = None
+                    self.statistics = None
+                    return True
+                return False
+            if result[1] != self.searchID or not self.searching:
+                continue #Left over from a cancelled search.
+            if result[0] == "info":
+                self.lastInfo = result
+            else:
+                self.bestMoveID = result[2]
+                self.statistics = result[3]
+                self.searching = False
+                return True
+
+    def close(self):
+        self.stop()
+        self.commands.put(("quit",))
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
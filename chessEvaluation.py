@@ -0,0 +1,179 @@
+# Evaluation tables shared by the gameState (which keeps running totals of them in makeMove/undoMove) and the bot. All values are in centipawns.
+
+PIECE_VALUES = {"K": 0, "Q": 900, "R": 500, "B": 300, "N": 300, "P": 100}
+
+#Piece-square bonuses from White's point of view. Row 0 is the 8th rank, the same orientation as gameState.board. Black uses the tables mirrored top to bottom.
+
+PAWN_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+]
+
+KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+]
+
+BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+]
+
+ROOK_TABLE = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0,
+]
+
+QUEEN_TABLE = [
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+]
+
+KING_TABLE = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20,
+]
+
+#Piece-square tables keyed by the board's piece strings ("wP", "bK"...), indexed by square row * 8 + col.
+
+PIECE_SQUARE_TABLES = {}
+for piece, whiteTable in (("P", PAWN_TABLE), ("N", KNIGHT_TABLE), ("B", BISHOP_TABLE), ("R", ROOK_TABLE), ("Q", QUEEN_TABLE), ("K", KING_TABLE)):
+    PIECE_SQUARE_TABLES["w" + piece] = whiteTable
+    PIECE_SQUARE_TABLES["b" + piece] = [whiteTable[(7 - square // 8) * 8 + square % 8] for square in range(64)]
+
+#Batched evaluation with NumPy. Scores a whole stack of positions in one vectorized pass, e.g. every child of a frontier node, instead of one position at a time.
+#NumPy is optional, the engine runs without it and chessBot only uses this path when it is installed.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MOBILITY_WEIGHT = 2 #Centipawns per square a piece can step to.
+
+#Signed int8 code per piece for the (N, 64) encoding, White positive and Black negative, 0 is an empty square. Plane order of the (N, 12, 64) encoding is wP..wK then bP..bK.
+
+PIECE_CODES = {"--": 0}
+for index, piece in enumerate("PNBRQK"):
+    PIECE_CODES["w" + piece] = index + 1
+    PIECE_CODES["b" + piece] = -(index + 1)
+PLANE_PIECES = ["w" + piece for piece in "PNBRQK"] + ["b" + piece for piece in "PNBRQK"]
+
+#Builds a (64, 64) mask where [from, to] is 1 if a single step takes a piece from 'from' to 'to'.
+
+def buildStepMask(steps):
+    mask = np.zeros((64, 64), dtype = np.int16)
+    for square in range(64):
+        row, col = divmod(square, 8)
+        for dRow, dCol in steps:
+            if 0 <= row + dRow < 8 and 0 <= col + dCol < 8:
+                mask[square, (row + dRow) * 8 + col + dCol] = 1
+    return mask
+
+if np is not None:
+    #Material plus piece-square value of each code on each square, indexed [code + 6, square]. Black rows are negated so a plain sum gives White minus Black.
+    CODE_SQUARE_VALUES = np.zeros((13, 64), dtype = np.int32)
+    for piece, code in PIECE_CODES.items():
+        if piece != "--":
+            sign = 1 if code > 0 else -1
+            CODE_SQUARE_VALUES[code + 6] = sign * (PIECE_VALUES[piece[1]] + np.array(PIECE_SQUARE_TABLES[piece]))
+    PLANE_CODES = np.array([PIECE_CODES[piece] for piece in PLANE_PIECES], dtype = np.int8)
+    SQUARE_INDEX = np.arange(64)
+    #Simple mobility masks: Knight jumps, and the first step along each line for sliders (a cheap stand-in for their full rays).
+    MOBILITY_MASKS = {
+        "N": buildStepMask(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))),
+        "B": buildStepMask(((-1, -1), (-1, 1), (1, -1), (1, 1))),
+        "R": buildStepMask(((-1, 0), (0, -1), (1, 0), (0, 1))),
+        "Q": buildStepMask(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))),
+    }
+
+#Encodes a gameState.board as a (64,) int8 array of piece codes.
+
+def encodeBoard(board):
+    return np.array([PIECE_CODES[piece] for row in board for piece in row], dtype = np.int8)
+
+#Encodes the position after each move as rows of an (N, 64) array, by patching copies of the parent's encoding. No makeMove/undoMove needed.
+
+def encodeChildren(parentCodes, moves):
+    children = np.repeat(parentCodes[np.newaxis, :], len(moves), axis = 0)
+    rows = []
+    squares = []
+    codes = []
+    for i in range(len(moves)):
+        move = moves[i]
+        start = move.startRow * 8 + move.startCol
+        end = move.endRow * 8 + move.endCol
+        placed = move.pieceMoved[0] + move.promotionChoice if move.pawnPromotion else move.pieceMoved
+        rows += (i, i)
+        squares += (start, end)
+        codes += (0, PIECE_CODES[placed])
+        if move.enPassant:
+            rows.append(i)
+            squares.append(move.startRow * 8 + move.endCol)
+            codes.append(0)
+        elif move.castleMove:
+            rook = PIECE_CODES[move.pieceMoved[0] + "R"]
+            if move.endCol - move.startCol == 2: #Kingside Castle move.
+                rookFrom, rookTo = end + 1, end - 1
+            else: #Queenside Castle move.
+                rookFrom, rookTo = end - 2, end + 1
+            rows += (i, i)
+            squares += (rookFrom, rookTo)
+            codes += (0, rook)
+    children[rows, squares] = codes
+    return children
+
+#Scores a stack of positions in centipawns from White's point of view: material, piece-square tables and mobility.
+#'positions' is an (N, 64) int8 array of piece codes or an (N, 12, 64) array of piece planes. Returns an (N,) int32 array.
+
+def scorePositions(positions, mobilityWeight = MOBILITY_WEIGHT):
+    positions = np.asarray(positions)
+    if positions.ndim == 3:
+        positions = (positions.astype(np.int8) * PLANE_CODES[np.newaxis, :, np.newaxis]).sum(axis = 1, dtype = np.int8)
+    scores = CODE_SQUARE_VALUES[positions + 6, SQUARE_INDEX].sum(axis = 1, dtype = np.int32)
+    if mobilityWeight:
+        notWhite = positions <= 0
+        notBlack = positions >= 0
+        mobility = np.zeros(len(positions), dtype = np.int32)
+        for piece, mask in MOBILITY_MASKS.items():
+            code = PIECE_CODES["w" + piece]
+            mobility += (((positions == code).astype(np.int16) @ mask) * notWhite).sum(axis = 1)
+            mobility -= (((positions == -code).astype(np.int16) @ mask) * notBlack).sum(axis = 1)
+        scores += mobilityWeight * mobility
+    return scores
@@ -4,7 +4,7 @@ import pygame as p
 from pygame import mixer
 import chessEngineSmart
 import chessBot as c
-from multiprocessing import Process, Queue
+from chessEngineWorker import engineWorker
 
 WIDTH = HEIGHT = 512
 LOG_WIDTH = 256
@@ -12,13 +12,22 @@ LOG_HEIGHT = HEIGHT
 DIMENSION = 8
 SQ_SIZE = HEIGHT / DIMENSION
 MAX_FPS = 15
+PONDER = True #Let the engine think about its next move during the human's turn.
 PIECES = {}
 LETTERS = {}
 NUMBERS = {}
+DOTS = {}
+SOUNDS = {}
+BOARD = None #The squares with their coordinates, drawn once by loadImages. A square is redrawn from its part of this surface.
+drawnSquares = {} #What each square on screen shows, (row, col) -> (piece, highlight color, dot radius). Only squares that no longer match are redrawn.
+drawnLog = None #logVersion of the move log on screen.
+logLines = [] #(moves, rendered text) of every move log line, a line is only rendered again when its moves change.
 
 #Initialize a global directory of pieces, letter coordinates, and number coordinates as images. This will be called one time in the main.
+#Also renders the static board, so the squares and coordinates are not drawn again every frame.
 
-def loadImages():
+def loadImages(numberCoordinates, letterCoordinates):
+    global BOARD
     pieces = ["wP", 'wN', "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK"]
     letters = ["-a", "-b", "-c", "-d", "-e", "-f", "-g", "-h"]
     numbers = ["8-", "7-", "6-", "5-", "4-", "3-", "2-", "1-"]
@@ -29,25 +38,41 @@ def loadImages():
         LETTERS[letter] = p.transform.scale(p.image.load("Chess/letterCoordinates/" + letter + ".png"), (SQ_SIZE, SQ_SIZE))
     for number in numbers:
         NUMBERS[number] = p.transform.scale(p.image.load("Chess/numberCoordinates/" + number + ".png"), (SQ_SIZE, SQ_SIZE))
+    for radius in (10, 30): #Empty squares get the small dot, squares with a piece the large one.
+        DOTS[radius] = p.Surface((SQ_SIZE, SQ_SIZE), p.SRCALPHA)
+        p.draw.circle(DOTS[radius], p.Color(0, 0, 0, 128), (0, 0), radius)
+    BOARD = p.Surface((WIDTH, HEIGHT))
+    drawBoard(BOARD)
+    drawLetters(BOARD, letterCoordinates)
+    drawNumbers(BOARD, numberCoordinates)
 
 #Accesses an image by calling 'PIECES['wQ']', 'LETTERS['a']', 'NUMBERS['1']' etc.
 
+#Decodes every sound once at start-up, so making a move does not read an MP3 from disk. Played by calling 'SOUNDS['capture'].play()' etc.
+
+def loadSounds():
+    sounds = ["game-start", "game-end", "move-self", "move-check", "capture", "castle"]
+    for sound in sounds:
+        SOUNDS[sound] = mixer.Sound("Chess/sounds/" + sound + ".mp3")
+
 #This is the main driver, will handle user input and updating graphics.
 
 def main():
     p.init()
     mixer.init()
-    mixer.music.load("Chess/sounds/game-start.mp3")
-    mixer.music.play()
+    loadSounds()
+    SOUNDS["game-start"].play()
     screen = p.display.set_mode((WIDTH + LOG_WIDTH, HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color("#FFFFFF"))
     logFont = p.font.SysFont("Segoe_UI", 16, True, False)
+    textFont = p.font.SysFont("Segoe_UI", 32, True, False)
     gs = chessEngineSmart.gameState()
     validMoves = gs.getValidMoves()
     moveMade = False #Flag variable for when a move is made.
+    logVersion = 0 #Changes whenever a move is made or undone or the board is reset, so the move log is only redrawn then.
     animate = False #Flag variable for when a move is animated.
-    loadImages()
+    loadImages(gs.numberCoordinates, gs.letterCoordinates)
     running = True
     sqSelected = () #No square is initially selected and will keep track of the last click of the user (tuple).
     playerClicks = [] #Keep track of player clicks (two tuples).
@@ -55,14 +80,17 @@ def main():
     playerOne = True #If a human is playing White, then this will be true. If an AI is playing White, then false.
     playerTwo = False #If a human is playing Black, then this will be true. If an AI is playing Black, then false.
     AIThinking = False #True whenever AI is coming up with a move, false otherwise.
-    moveFinderProcess = None
+    engine = engineWorker() #One engine process for the whole session, it mirrors every move made on gs. It searches with chessBot.SMP_WORKERS processes.
     moveUndone = False
+    shownText = None #End of game message on screen.
 
     while running:
         humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
+            elif e.type == p.WINDOWEXPOSED:
+                p.display.flip() #Frames only update what changed, so a window uncovered by the OS gets all of it once.
             #Mouse handler.
             elif e.type == p.MOUSEBUTTONDOWN:
                 if not gameOver:
@@ -81,6 +109,7 @@ def main():
                         for i in range(len(validMoves)):
                             if move == validMoves[i]:
                                 gs.makeMove(validMoves[i])
+                                engine.pushMove(validMoves[i])
                                 moveMade = True
                                 animate = True
                                 sqSelected = () #Reset user clicks.
@@ -90,146 +119,159 @@ def main():
             #Event handlers.
             elif e.type == p.KEYDOWN:               
                 if e.key == p.K_u: #Undo last made move when the "u" key is pressed.
+                    if len(gs.moveLog) != 0:
+                        engine.undoMove() #Also cancels a search in progress.
                     gs.undoMove()
                     sqSelected = ()
                     playerClicks = []
                     moveMade = True
                     animate = False
                     gameOver = False
-                    if AIThinking:
-                        moveFinderProcess.terminate()
-                        AIThinking = False
+                    AIThinking = False
                     moveUndone = True
                 if e.key == p.K_r: #Resets the board when the "r" key is pressed.
                     gs = chessEngineSmart.gameState()
                     validMoves = gs.getValidMoves()
+                    logVersion += 1
                     sqSelected = ()
                     playerClicks = []
                     moveMade = False
                     animate = False
                     gameOver = False
-                    if AIThinking:
-                        moveFinderProcess.terminate()
-                        AIThinking = False
+                    engine.newGame()
+                    AIThinking = False
                     moveUndone = True
-                    mixer.music.load("Chess/sounds/game-start.mp3")
-                    mixer.music.play()
+                    SOUNDS["game-start"].play()
 
         #AI move finder logic.
 
         if not gameOver and not humanTurn and not moveUndone:
             if not AIThinking:
                 AIThinking = True
-                returnQueue = Queue() #Used to pass data between threads.
-                moveFinderProcess = Process(target = c.findBestMove, args = (gs, validMoves, returnQueue))
-                moveFinderProcess.start() #Calls the function with these parameters.
+                engine.go() #The engine already has the position, only the limits are sent. After a ponder hit it is searching already.
 
-            if not moveFinderProcess.is_alive():
-                AIMove = returnQueue.get()
+            if engine.poll():
+                AIMove = gs.getMoveFromID(engine.bestMoveID) if engine.bestMoveID is not None else None
                 if AIMove is None:
                     AIMove = c.findRandomMove(validMoves)
                 gs.makeMove(AIMove)
+                engine.pushMove(AIMove)
+                if PONDER and ((gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)):
+                    engine.ponder(AIMove) #Search the reply the engine expects while the human thinks.
                 moveMade = True
                 animate = True
                 AIThinking = False
 
         if moveMade:
             if gs.isCheck():
-                sound = p.mixer.Sound("Chess/sounds/move-check.mp3")
-                p.mixer.Sound.play(sound)
+                SOUNDS["move-check"].play()
             elif gs.moveIsCastle:
-                sound = p.mixer.Sound("Chess/sounds/castle.mp3")
-                p.mixer.Sound.play(sound)
+                SOUNDS["castle"].play()
             elif gs.moveIsCapture:
-                sound = p.mixer.Sound("Chess/sounds/capture.mp3")
-                p.mixer.Sound.play(sound)    
-            elif moveUndone:
-                sound = p.mixer.Sound("Chess/sounds/move-self.mp3")
-                p.mixer.Sound.play(sound)
+                SOUNDS["capture"].play()
             else:
-                sound = p.mixer.Sound("Chess/sounds/move-self.mp3")
-                p.mixer.Sound.play(sound)
+                SOUNDS["move-self"].play()
             if animate:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock, gs.numberCoordinates, gs.letterCoordinates)
+                animateMove(gs.moveLog[-1], screen, gs.board, clock)
             validMoves = gs.getValidMoves()
+            logVersion += 1 #A move made by the human or AI, or undone.
             moveMade = False
             animate = False
             moveUndone = False
 
-        drawGameState(screen, gs, validMoves, sqSelected, logFont)
         #Checks if game is over.
-        soundPlayed = False
+        text = None
         if gs.checkmate:
-            while not soundPlayed:
-                sound = p.mixer.Sound("Chess/sounds/game-end.mp3")
-                p.mixer.Sound.play(sound)
-                soundPlayed = True
             gameOver = True
             if gs.whiteToMove:
-                drawText(screen, 'Black Won! By Checkmate.')
+                text = 'Black Won! By Checkmate.'
             else:
-                drawText(screen, 'White Won! By Checkmate.')
+                text = 'White Won! By Checkmate.'
         elif gs.stalemate:
-            while not soundPlayed:
-                sound = p.mixer.Sound("Chess/sounds/game-end.mp3")
-                p.mixer.Sound.play(sound)
-                soundPlayed = True
             gameOver = True
-            drawText(screen, 'Stalemate.')
-
+            text = 'Stalemate.'
+        elif gs.isRepetition(3) or gs.isFiftyMoveDraw():
+            gameOver = True
+            text = 'Draw by repetition.' if gs.isRepetition(3) else 'Draw by the fifty-move rule.'
+        if text != shownText:
+            if text is not None:
+                SOUNDS["game-end"].play() #Once, when the game ends.
+            drawnSquares.clear() #Redraw the whole board, it is under the message that goes or comes.
+            shownText = text
+
+        dirtyRects = drawGameState(screen, gs, validMoves, sqSelected, logFont, logVersion)
+        if text is not None and dirtyRects:
+            dirtyRects.append(drawText(screen, text, textFont)) #Back on top of the squares just redrawn.
         clock.tick(MAX_FPS)
-        p.display.flip()
+        p.display.update(dirtyRects)
+    engine.close()
 
-#Highlights square selected, draws dots on squares with valid moves
+#Highlight color of the square selected, None if it is not highlighted.
 
-def highlightSquares(screen, gs, sqSelected):
+def getHighlight(gs, sqSelected):
     if sqSelected != ():
         row, col = sqSelected
         if gs.board[row][col][0] == ('w' if gs.whiteToMove else 'b'): #Makes sure square selected is a piece that can be moved
             state = p.mouse.get_pressed()
-            if state[2]: #Will handle right-clicks
-                s = p.Surface((SQ_SIZE, SQ_SIZE))
-                rightClickColor = [p.Color("#DE846F"), p.Color("#C87358")]
-                s.fill(rightClickColor[(row + col) % 2])
-                screen.blit(s, (col * SQ_SIZE, row * SQ_SIZE))
             if state[0]: #Will handle left-clicks
-                t = p.Surface((SQ_SIZE, SQ_SIZE))
                 leftClickColor = [p.Color("#F5F598"), p.Color("#BFCB5F")]
-                t.fill(leftClickColor[(row + col) % 2])
-                screen.blit(t, (col * SQ_SIZE, row * SQ_SIZE))
+                return leftClickColor[(row + col) % 2]
+            if state[2]: #Will handle right-clicks
+                rightClickColor = [p.Color("#DE846F"), p.Color("#C87358")]
+                return rightClickColor[(row + col) % 2]
+    return None
 
-#Draw dots on squares with valid moves
+#Dots on squares with valid moves, (row, col) -> dot radius.
 
-def drawDots(screen, gs, validMoves, sqSelected):
+def getDots(gs, validMoves, sqSelected):
+    dots = {}
     if sqSelected != ():
         row, col = sqSelected
         if gs.board[row][col][0] == ('w' if gs.whiteToMove else 'b'): #Makes sure square selected is a piece that can be moved
             for move in validMoves:
                 if move.startRow == row and move.startCol == col:
                     if gs.board[move.endRow][move.endCol] == "--": #Empty Squares
-                        u = p.Surface((SQ_SIZE, SQ_SIZE), p.SRCALPHA)
-                        p.draw.circle(u, p.Color(0, 0, 0, 128), (0, 0), 10)
-                        screen.blit(u, ((move.endCol * SQ_SIZE + SQ_SIZE // 2, move.endRow * SQ_SIZE + SQ_SIZE // 2)))
+                        dots[(move.endRow, move.endCol)] = 10
                     else: #Squares with another piece
-                        v = p.Surface((SQ_SIZE, SQ_SIZE), p.SRCALPHA)
-                        p.draw.circle(v, (0, 0, 0, 128), (0, 0), 30)
-                        screen.blit(v, ((move.endCol * SQ_SIZE + SQ_SIZE // 2, move.endRow * SQ_SIZE + SQ_SIZE // 2)))
+                        dots[(move.endRow, move.endCol)] = 30
+    return dots
 
-#Responsible for all graphics within current game state
+#Responsible for all graphics within current game state. Only squares that changed since the last frame are drawn again (and the move log when a move was made or undone).
+#Returns the rectangles drawn, for p.display.update.
 
-def drawGameState(screen, gs, validMoves, sqSelected, logFont):
-    drawBoard(screen) #Draws squares
-    drawLetters(screen, gs.letterCoordinates)
-    drawNumbers(screen, gs.numberCoordinates)
-    drawLog(screen, gs, logFont)
-    highlightSquares(screen, gs, sqSelected)
-    drawPieces(screen, gs.board)
-    drawDots(screen, gs, validMoves, sqSelected)
+def drawGameState(screen, gs, validMoves, sqSelected, logFont, logVersion):
+    global drawnLog
+    dirtyRects = []
+    highlight = getHighlight(gs, sqSelected)
+    dots = getDots(gs, validMoves, sqSelected)
+    for row in range(DIMENSION):
+        for col in range(DIMENSION):
+            square = (gs.board[row][col], highlight if (row, col) == sqSelected else None, dots.get((row, col)))
+            if drawnSquares.get((row, col)) != square:
+                dirtyRects.append(drawSquare(screen, row, col, *square))
+                drawnSquares[(row, col)] = square
+    if logVersion != drawnLog:
+        dirtyRects.append(drawLog(screen, gs, logFont))
+        drawnLog = logVersion
+    return dirtyRects
+
+#Draws one square from the static board: highlight, piece, then dot.
+
+def drawSquare(screen, row, col, piece, highlight, dot):
+    square = p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+    if highlight is None:
+        screen.blit(BOARD, square, square)
+    else:
+        screen.fill(highlight, square)
+    if piece != "--":
+        screen.blit(PIECES[piece], square)
+    if dot is not None:
+        screen.blit(DOTS[dot], (col * SQ_SIZE + SQ_SIZE // 2, row * SQ_SIZE + SQ_SIZE // 2))
+    return square
 
 #Draws the squares on the board. Top-left squares is ALWAYS LIGHT. Also keeps track of which squares are light and dark.
 
 def drawBoard(screen):
-    global colors
     colors = [p.Color("#eeeed2"), p.Color("#769656")]
     for row in range(DIMENSION):
         for col in range(DIMENSION):
@@ -264,67 +306,77 @@ def drawNumbers(screen, numberCoordinates):
             if number != "--":
                 screen.blit(NUMBERS[number], p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
-#Draws the move log on the side of the board.
+#Draws the move log on the side of the board. Lines are rendered once and kept in logLines, a move only renders the line it lands on.
 
 def drawLog(screen, gs, font):
 
     moveLogRect = p.Rect(WIDTH, 0, LOG_WIDTH, LOG_HEIGHT)
     p.draw.rect(screen, p.Color("#302E2B"), moveLogRect)
     moveLog = gs.moveLog
-    moveText = []
-    for i in range(0, len(moveLog), 2):
-        moveString = str(i // 2 + 1) + ". " + str(moveLog[i]) + " "
-        if i + 1 < len(moveLog): #Make sure Black made a move.
-            moveString += str(moveLog[i + 1])
-        moveText.append(moveString)
     movesPerRow = 3
     padding = 5
     spacing = 2
     textY = padding
-    for i in range(0, len(moveText), movesPerRow):
-        text = ""
-        for j in range(movesPerRow):
-            if i + j < len(moveText):
-                text += moveText[i + j]
-        textObject = font.render(text, True, p.Color("#FFFFFF"))
+    pliesPerRow = 2 * movesPerRow
+    lineCount = (len(moveLog) + pliesPerRow - 1) // pliesPerRow
+    del logLines[lineCount:] #Lines of undone moves.
+    changed = False #Once a line changed, the ones after it are from another game and are rendered again too.
+    for line in range(lineCount):
+        moves = tuple(moveLog[line * pliesPerRow:(line + 1) * pliesPerRow])
+        if changed or line == len(logLines) or logLines[line][0] != moves:
+            changed = True
+            text = ""
+            for i in range(0, len(moves), 2):
+                text += str(line * movesPerRow + i // 2 + 1) + ". " + str(moves[i]) + " "
+                if i + 1 < len(moves): #Make sure Black made a move.
+                    text += str(moves[i + 1])
+            if line == len(logLines):
+                logLines.append(None)
+            logLines[line] = (moves, font.render(text, True, p.Color("#FFFFFF")))
+        textObject = logLines[line][1]
         textLocation = moveLogRect.move(padding, textY)
         screen.blit(textObject, textLocation)
         textY += textObject.get_height() + spacing
+    return moveLogRect
 
-#Animation of moves.
+#Animation of moves. The board behind the moving piece is rendered once, each frame only puts back the piece's last square and draws it on its next one.
 
-def animateMove(move, screen, board, clock, numberCoordinates, letterCoordinates):
-    global colors
+def animateMove(move, screen, board, clock):
     dR = move.endRow - move.startRow #Delta move row (Change in row)
     dC = move.endCol - move.startCol #Delta move column (Change in column)
     fps = 3 #FramesPerSquare
     frameCount = (abs(dR) + abs(dC)) * fps
+    background = BOARD.copy()
+    drawPieces(background, board)
+    #Erase the piece moved from its ending square.
+    endSquare = p.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+    background.blit(BOARD, endSquare, endSquare)
+    #Draw captured piece back onto square.
+    if move.pieceCaptured != '--':
+        background.blit(PIECES[move.pieceCaptured], endSquare)
+    screen.blit(background, (0, 0))
+    dirtyRects = [background.get_rect()]
     for frame in range(frameCount + 1):
         row, col = ((move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount))
-        drawBoard(screen)
-        drawPieces(screen, board)
-        drawNumbers(screen, numberCoordinates)
-        drawLetters(screen, letterCoordinates)
-        #Erase the piece moved from its ending square.
-        color = colors[(move.endRow + move.endCol) % 2]
-        endSquare = p.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, endSquare)
-        #Draw captured piece back onto square.
-        if move.pieceCaptured != '--':
-            screen.blit(PIECES[move.pieceCaptured], endSquare)
         #Draw the moving piece.
-        screen.blit(PIECES[move.pieceMoved], p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
+        pieceRect = p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        screen.blit(PIECES[move.pieceMoved], pieceRect)
+        p.display.update(dirtyRects + [pieceRect])
         clock.tick(60)
+        screen.blit(background, pieceRect, pieceRect)
+        dirtyRects = [pieceRect]
+    drawnSquares.clear() #The board was drawn without highlights or dots, the next frame draws it all again.
+
+#Draws text over the middle of the board and returns where.
 
-def drawText(screen, text):
-    font = p.font.SysFont('Segoe_UI', 32, True, False)
+def drawText(screen, text, font):
     textObject = font.render(text, 0, p.Color("#9B9B9B"))
     textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH / 2 - textObject.get_width() / 2, HEIGHT / 2 - textObject.get_height() / 2)
     screen.blit(textObject, textLocation)
+    return p.Rect(textLocation.topleft, textObject.get_size())
 
 if __name__ == "__main__":
     main()
 
 
-#IDEAS: Move highlight for last move made, a UI for when the game concludes, stalemate on repeated moves
\ No newline at end of file
+#IDEAS: Move highlight for last move made, a UI for when the game concludes
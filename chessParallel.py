@@ -0,0 +1,113 @@
+# Lazy SMP search. Several processes run chessBot's iterative deepening on the same root at once, sharing one transposition table in shared memory.
+#Each process benefits from the entries the others store, and the deepest iteration any of them completes is the answer.
+#Selected by chessBot.SMP_WORKERS above 1 (chessUCI: setoption name Threads). Usage: python chessParallel.py --fen "<fen>" --depth 5 [--max-workers 8]    (time-to-depth benchmark for 1..max-workers processes)
+
+import argparse
+import multiprocessing
+import queue
+import sys
+import time
+import chessEngineSmart
+import chessBot
+
+WORKERS = 4 #Search processes used when the caller does not say.
+POLL_INTERVAL = 0.01 #Seconds between the coordinating process's checks of its clock and stop request while it waits for results.
+
+#Runs in each search process. Odd numbered workers start one iteration deeper, so the processes are spread over neighbouring depths instead of all repeating the same one.
+
+def searchWorker(workerIndex, gs, sharedTable, stopFlag, results, timeLimit, nodeLimit, maxDepth):
+    chessBot.SMP_WORKERS = 1 #Each process runs the ordinary search.
+    chessBot.table = sharedTable
+    chessBot.stopRequest = lambda: stopFlag.value != 0
+    startDepth = min(1 + workerIndex % 2, maxDepth)
+    reportIteration = lambda depth, score, nodes, seconds, pv: results.put(("iteration", workerIndex, depth, score, nodes, seconds, list(pv)))
+    bestMove = chessBot.iterativeDeepening(gs, gs.getValidMoves(), timeLimit, nodeLimit, maxDepth, reportIteration, startDepth)
+    results.put(("done", workerIndex, bestMove.moveID if bestMove is not None else None, chessBot.nodesSearched))
+    sharedTable.close()
+
+#Searches gs with 'workers' processes until the time/node budget runs out, one of them finishes, or one completes maxDepth.
+#Returns (best move of the deepest completed iteration, that depth, total nodes searched by all processes). chessBot.iterativeDeepening runs this when SMP_WORKERS is above 1.
+#The calling process keeps the clock in chessBot.deadline and watches chessBot.stopRequest, so a stop or a ponder hit that sets the deadline (see chessEngineWorker) reaches every process.
+#'reportIteration' is called as in iterativeDeepening, each time a process completes a deeper iteration than any before (with that process's nodes).
+
+def lazySMPSearch(gs, workers = WORKERS, timeLimit = chessBot.TIME_LIMIT, nodeLimit = chessBot.NODE_LIMIT, maxDepth = chessBot.MAX_DEPTH, reportIteration = None):
+    if not gs.getValidMoves():
+        return None, 0, 0 #Checkmate or stalemate.
+    startTime = time.perf_counter()
+    chessBot.deadline = startTime + timeLimit if timeLimit is not None else None
+    chessBot.searchNodeLimit = nodeLimit
+    sharedTable = chessBot.sharedTranspositionTable(chessBot.TT_SIZE)
+    stopFlag = multiprocessing.Value("i", 0, lock = False)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target = searchWorker, args = (i, gs, sharedTable, stopFlag, results, timeLimit, nodeLimit, maxDepth), daemon = True)
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    bestMoveID = None
+    bestDepth = 0
+    fallbackMoveID = None
+    totalNodes = 0
+    finished = 0
+    while finished < workers:
+        try:
+            message = results.get(timeout = POLL_INTERVAL)
+        except queue.Empty:
+            message = None
+        if stopFlag.value == 0 and ((chessBot.stopRequest is not None and chessBot.stopRequest()) or
+                                    (chessBot.deadline is not None and time.perf_counter() >= chessBot.deadline)):
+            stopFlag.value = 1
+        if message is None:
+            continue
+        if message[0] == "iteration":
+            depth, score, nodes, pv = message[2], message[3], message[4], message[6]
+            if depth > bestDepth and pv:
+                bestDepth = depth
+                bestMoveID = pv[0]
+                if reportIteration is not None:
+                    reportIteration(depth, score, nodes, time.perf_counter() - startTime, pv)
+            if depth >= maxDepth:
+                stopFlag.value = 1
+        else:
+            finished += 1
+            totalNodes += message[3]
+            if fallbackMoveID is None:
+                fallbackMoveID = message[2]
+            stopFlag.value = 1 #The first process to finish ends the search for all of them.
+    for process in processes:
+        process.join()
+    sharedTable.close()
+    sharedTable.unlink()
+    chessBot.nodesSearched = totalNodes
+    if bestMoveID is None: #No iteration completed (or only one legal move), use a worker's own answer.
+        bestMoveID = fallbackMoveID
+    return (gs.getMoveFromID(bestMoveID) if bestMoveID is not None else None), bestDepth, totalNodes
+
+#Time to reach 'depth' with 1, 2, ... maxWorkers processes, printed as a table with the speedup over one process.
+
+def benchmark(fen, depth, maxWorkers = 8, backend = "bitboard"):
+    print("Workers  Seconds  Speedup  Nodes  Move")
+    baseTime = None
+    for workers in range(1, maxWorkers + 1):
+        gs = chessEngineSmart.newGameState(backend)
+        gs.loadFEN(fen)
+        start = time.perf_counter()
+        move, reached, nodes = lazySMPSearch(gs, workers, None, None, depth)
+        elapsed = time.perf_counter() - start
+        if baseTime is None:
+            baseTime = elapsed
+        print(format(workers, "7d") + "  " + format(elapsed, "7.2f") + "  " + format(baseTime / elapsed, "6.2f") + "x  " + str(nodes) + "  " +
+              (move.getUCINotation() if move is not None else "none") + ("" if reached >= depth else " (depth " + str(reached) + ")"))
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Lazy SMP time-to-depth benchmark.")
+    parser.add_argument("--fen", default = chessEngineSmart.START_FEN, help = "position to search (default: start position)")
+    parser.add_argument("--depth", type = int, default = 5)
+    parser.add_argument("--max-workers", type = int, default = 8)
+    parser.add_argument("--backend", choices = ("mailbox", "bitboard"), default = "bitboard")
+    args = parser.parse_args(argv)
+    print(str(multiprocessing.cpu_count()) + " cores available")
+    benchmark(args.fen, args.depth, args.max_workers, args.backend)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# Headless perft driver. Counts the leaf nodes of the legal move tree through makeMove/undoMove, so every move generator change can be checked against known counts and timed.
+#Usage: python chessPerft.py --fen "<fen>" --depth 4 [--divide] [--backend bitboard]
+#       python chessPerft.py --suite [--max-nodes 1000000]
+
+import argparse
+import sys
+import time
+import chessEngineSmart
+
+#Reference positions with their published node counts {depth: nodes}.
+
+REFERENCE_POSITIONS = [
+    ("Start position", chessEngineSmart.START_FEN,
+        {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609, 6: 119060324}),
+    ("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        {1: 48, 2: 2039, 3: 97862, 4: 4085603, 5: 193690690}),
+    ("En Passant and rank pins", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624, 6: 11030083}),
+    ("Promotions and castling", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        {1: 6, 2: 264, 3: 9467, 4: 422333, 5: 15833292}),
+    ("Promotion with capture", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        {1: 44, 2: 1486, 3: 62379, 4: 2103487, 5: 89941194}),
+    ("Middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    ("Illegal En Passant (rank pin)", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+        {6: 1134888}),
+    ("Illegal En Passant (diagonal pin)", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+        {6: 1015133}),
+    ("En Passant gives check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+        {6: 1440467}),
+    ("Short castling gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+        {6: 661072}),
+    ("Long castling gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+        {6: 803711}),
+    ("Castling rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+        {4: 1274206}),
+    ("Castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+        {4: 1720476}),
+    ("Promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+        {6: 3821001}),
+    ("Discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1",
+        {5: 1004658}),
+    ("Promote to give check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1",
+        {6: 217342}),
+    ("Underpromote to give check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+        {6: 92683}),
+    ("Self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+        {6: 2217}),
+    ("Stalemate and checkmate", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+        {7: 567584}),
+    ("Stalemate and checkmate 2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+        {4: 23527}),
+]
+
+#Counts leaf nodes 'depth' plies below the current position. The last ply is counted straight from the length of the move list.
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+#Perft split by root move. Returns a list of (move in long algebraic notation, nodes).
+
+def divide(gs, depth):
+    results = []
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        results.append((move.getUCINotation(), perft(gs, depth - 1)))
+        gs.undoMove()
+    return results
+
+#Runs perft on one position and prints the node count, wall time and nodes/sec. Returns the node count.
+
+def runPerft(fen, depth, backend = "mailbox", showDivide = False):
+    gs = chessEngineSmart.newGameState(backend)
+    gs.loadFEN(fen)
+    start = time.perf_counter()
+    if showDivide:
+        nodes = 0
+        for notation, moveNodes in sorted(divide(gs, depth)):
+            print(notation + ": " + str(moveNodes))
+            nodes += moveNodes
+        print()
+    else:
+        nodes = perft(gs, depth)
+    elapsed = time.perf_counter() - start
+    print("Depth " + str(depth) + ": " + str(nodes) + " nodes in " + format(elapsed, ".3f") + "s (" + format(nodesPerSecond(nodes, elapsed), ",.0f") + " nodes/sec)")
+    return nodes
+
+def nodesPerSecond(nodes, elapsed):
+    return nodes / elapsed if elapsed > 0 else 0.0
+
+#Runs every reference position at each depth whose expected count is at most 'maxNodes'. Returns True if all counts match.
+
+def runSuite(backend = "mailbox", maxNodes = 1000000):
+    allPassed = True
+    totalNodes = 0
+    totalTime = 0.0
+    for name, fen, expectedCounts in REFERENCE_POSITIONS:
+        for depth, expected in sorted(expectedCounts.items()):
+            if expected > maxNodes:
+                continue
+            gs = chessEngineSmart.newGameState(backend)
+            gs.loadFEN(fen)
+            start = time.perf_counter()
+            nodes = perft(gs, depth)
+            elapsed = time.perf_counter() - start
+            totalNodes += nodes
+            totalTime += elapsed
+            passed = nodes == expected
+            allPassed = allPassed and passed
+            print(("PASS " if passed else "FAIL ") + name + " depth " + str(depth) + ": " + str(nodes) +
+                  ("" if passed else " (expected " + str(expected) + ")") + " in " + format(elapsed, ".3f") + "s")
+    print("Total: " + str(totalNodes) + " nodes in " + format(totalTime, ".3f") + "s (" + format(nodesPerSecond(totalNodes, totalTime), ",.0f") + " nodes/sec)")
+    return allPassed
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Perft move generator test and benchmark.")
+    parser.add_argument("--fen", default = chessEngineSmart.START_FEN, help = "position to search (default: start position)")
+    parser.add_argument("--depth", type = int, default = 4)
+    parser.add_argument("--divide", action = "store_true", help = "print the node count below each root move")
+    parser.add_argument("--backend", choices = ("mailbox", "bitboard"), default = "mailbox")
+    parser.add_argument("--suite", action = "store_true", help = "check the reference positions against their known counts")
+    parser.add_argument("--max-nodes", type = int, default = 1000000, help = "skip suite entries expected to be larger than this")
+    args = parser.parse_args(argv)
+    if args.suite:
+        return 0 if runSuite(args.backend, args.max_nodes) else 1
+    runPerft(args.fen, args.depth, args.backend, args.divide)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+# Endgame tablebases for positions of up to 4 pieces, Kings included (KQK, KRK, KPK, KQKR...). A table holds the exact number of plies to Checkmate
+#with best play for every position of its material, so the bot plays these endings from lookups instead of searching for a mate it is too shallow to see.
+#Tables are built by retrograde analysis: the Checkmates are resolved first, then positions are resolved backwards one ply at a time from the ones already known.
+#Every position's moves come from gameState.getValidMoves, so the tables follow the same rules the engine plays by. Castling and En Passant are left out.
+#A table is a short header and one byte per position, written to <signature>.tb (e.g. KQvK.tb) in TABLEBASE_DIR and memory-mapped when probed.
+#Usage: python chessTablebase.py [KQvK KRvK KPvK ...] [--dir tablebases]
+
+import argparse
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+import chessEngineSmart
+from chessEngineSmart import castleRights, KNIGHT_TARGETS, KING_TARGETS, RAY_TARGETS
+from chessEvaluation import PIECE_VALUES
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases") #Default location, the engine just searches if there are no tables.
+MAX_PIECES = 4
+DEFAULT_SIGNATURES = ("KQvK", "KRvK", "KPvK")
+DRAWN_SIGNATURES = ("KvK", "KBvK", "KNvK") #Checkmate is impossible, these need no table.
+PIECE_ORDER = "KQRBNP" #Order of the pieces in a signature and in a table's index.
+MAGIC = b"CETB"
+VERSION = 1
+HEADER_FORMAT = ">4sHH" #Magic, version, number of pieces.
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+#Table values, from the point of view of the side to move. 1 to 127 mates in that many plies, LOSS + n is mated in n plies (LOSS itself is Checkmate).
+#DRAW is also stored for illegal positions, they are never probed.
+
+DRAW = 0
+LOSS = 128
+
+#Squares each piece can step or slide to, as square numbers (row * 8 + col), for the backward moves of the retrograde pass.
+
+KNIGHT_SQUARES = [[row * 8 + col for row, col in targets] for targets in KNIGHT_TARGETS]
+KING_SQUARES = [[row * 8 + col for row, col in targets] for targets in KING_TARGETS]
+RAY_SQUARES = [[[row * 8 + col for row, col in targets] for targets in direction] for direction in RAY_TARGETS]
+SLIDER_RAYS = {"R": RAY_SQUARES[:4], "B": RAY_SQUARES[4:], "Q": RAY_SQUARES}
+
+#Signature of a list of pieces ("wK", "bQ"...), White's pieces then Black's, each in PIECE_ORDER: ["bK", "wQ", "wK"] -> "KQvK".
+
+def getSignature(pieces):
+    white = sorted((piece[1] for piece in pieces if piece[0] == "w"), key = PIECE_ORDER.index)
+    black = sorted((piece[1] for piece in pieces if piece[0] == "b"), key = PIECE_ORDER.index)
+    return "".join(white) + "v" + "".join(black)
+
+#Pieces of a signature in table order: "KQvK" -> ["wK", "wQ", "bK"].
+
+def getSlots(signature):
+    white, black = signature.split("v")
+    return ["w" + piece for piece in white] + ["b" + piece for piece in black]
+
+#The same material with the colors swapped: "KvKQ" -> "KQvK".
+
+def swapSignature(signature):
+    white, black = signature.split("v")
+    return black + "v" + white
+
+#Of a signature and its color swapped twin, the one tables are generated for: the side with more material plays White.
+
+def canonicalSignature(signature):
+    white, black = signature.split("v")
+    whiteKey = (sum(PIECE_VALUES[piece] for piece in white), len(white), white)
+    blackKey = (sum(PIECE_VALUES[piece] for piece in black), len(black), black)
+    return signature if whiteKey >= blackKey else swapSignature(signature)
+
+#Position of the pieces [(piece, square)] in a table of these slots. The side to move is the highest digit, then one base 64 digit per slot.
+
+def getIndex(slots, pieces, whiteToMove):
+    squares = {}
+    for piece, square in pieces:
+        squares.setdefault(piece, []).append(square)
+    index = 0 if whiteToMove else 1
+    for piece in slots:
+        index = index * 64 + squares[piece].pop()
+    return index
+
+def getTablePath(directory, signature):
+    return os.path.join(directory, signature + ".tb")
+
+#One memory-mapped table.
+
+class endgameTable():
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        self.signature = os.path.basename(path)[:-3]
+        self.slots = getSlots(self.signature)
+        magic, version, pieceCount = struct.unpack_from(HEADER_FORMAT, self.data, 0)
+        if magic != MAGIC or version != VERSION or pieceCount != len(self.slots) or len(self.data) != HEADER_SIZE + 2 * 64 ** pieceCount:
+            self.close()
+            raise ValueError("Not a version " + str(VERSION) + " tablebase file: " + path)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def getValue(self, pieces, whiteToMove):
+        return self.data[HEADER_SIZE + getIndex(self.slots, pieces, whiteToMove)]
+
+#Every table found in a directory. Tables are opened the first time a position of their material is probed.
+
+class tablebaseSet():
+
+    def __init__(self, directory = TABLEBASE_DIR):
+        self.directory = directory
+        self.tables = {}
+        self.available = set(name[:-3] for name in os.listdir(directory) if name.endswith(".tb")) if os.path.isdir(directory) else set()
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+
+    def getTable(self, signature):
+        if signature not in self.available:
+            return None
+        if signature not in self.tables:
+            self.tables[signature] = endgameTable(getTablePath(self.directory, signature))
+        return self.tables[signature]
+
+    #Value of the position for the side to move, or None when there is no table for its material. A position with the material the other way round
+    #(e.g. KvKQ) is looked up in its twin's table with the board mirrored top to bottom and the colors swapped.
+
+    def probePieces(self, pieces, whiteToMove):
+        signature = getSignature([piece for piece, square in pieces])
+        if signature in DRAWN_SIGNATURES or swapSignature(signature) in DRAWN_SIGNATURES:
+            return DRAW
+        table = self.getTable(signature)
+        if table is None:
+            table = self.getTable(swapSignature(signature))
+            if table is None:
+                return None
+            pieces = [(("b" if piece[0] == "w" else "w") + piece[1], (7 - square // 8) * 8 + square % 8) for piece, square in pieces]
+            whiteToMove = not whiteToMove
+        return table.getValue(pieces, whiteToMove)
+
+    #Value of gs's position for the side to move, or None if it has more than MAX_PIECES pieces, Castle rights, an En Passant capture or no table.
+
+    def probe(self, gs):
+        rights = gs.currentCastlingRights
+        if rights.wks or rights.wqs or rights.bks or rights.bqs:
+            return None
+        if gs.enPassantPossible: #Only matters if a Pawn of the side to move stands next to the Pawn that just moved.
+            row, col = gs.enPassantPossible
+            pawnRow = row + 1 if gs.whiteToMove else row - 1
+            pawn = "wP" if gs.whiteToMove else "bP"
+            if (col > 0 and gs.board[pawnRow][col - 1] == pawn) or (col < 7 and gs.board[pawnRow][col + 1] == pawn):
+                return None
+        pieces = []
+        for row in range(8):
+            for col in range(8):
+                piece = gs.board[row][col]
+                if piece != "--":
+                    pieces.append((piece, row * 8 + col))
+                    if len(pieces) > MAX_PIECES:
+                        return None
+        return self.probePieces(pieces, gs.whiteToMove)
+
+#Signatures reached from this one by a capture or a promotion, the tables a new table looks its conversions up in.
+
+def getConversions(signature):
+    slots = getSlots(signature)
+    conversions = set()
+    for i in range(len(slots)):
+        piece = slots[i]
+        if piece[1] != "K":
+            conversions.add(getSignature(slots[:i] + slots[i + 1:]))
+        if piece[1] == "P":
+            for promotion in "QRBN":
+                conversions.add(getSignature(slots[:i] + [piece[0] + promotion] + slots[i + 1:]))
+    return conversions
+
+#Squares the piece on 'square' could have come from with a non-capturing move, given the occupied squares of the position after the move.
+
+def getRetroSquares(piece, square, occupied):
+    kind = piece[1]
+    if kind == "N" or kind == "K":
+        return [target for target in (KNIGHT_SQUARES if kind == "N" else KING_SQUARES)[square] if target not in occupied]
+    if kind == "P": #Pawns are pushed back, White's down the board and Black's up it.
+        step = 8 if piece[0] == "w" else -8
+        row = square // 8
+        origins = []
+        if 1 <= row + step // 8 <= 6 and square + step not in occupied:
+            origins.append(square + step)
+            if row == (4 if piece[0] == "w" else 3) and square + 2 * step not in occupied:
+                origins.append(square + 2 * step)
+        return origins
+    origins = []
+    for ray in SLIDER_RAYS[kind]:
+        for target in ray[square]:
+            if target in occupied:
+                break
+            origins.append(target)
+    return origins
+
+#Builds the table for 'signature' with retrograde analysis and writes it to 'directory'. The tables its captures and promotions lead to are generated first if they are missing.
+#Returns the longest mate in plies.
+
+def generateTable(signature, directory = TABLEBASE_DIR, backend = "bitboard"):
+    slots = getSlots(signature)
+    if len(slots) > MAX_PIECES or slots.count("wK") != 1 or slots.count("bK") != 1:
+        raise ValueError("Tables need one King per side and at most " + str(MAX_PIECES) + " pieces: " + signature)
+    os.makedirs(directory, exist_ok = True)
+    for conversion in sorted(getConversions(signature)):
+        conversion = canonicalSignature(conversion)
+        if conversion not in DRAWN_SIGNATURES and not os.path.exists(getTablePath(directory, conversion)) and not os.path.exists(getTablePath(directory, swapSignature(conversion))):
+            generateTable(conversion, directory, backend)
+    tablebases = tablebaseSet(directory)
+    start = time.perf_counter()
+    pieceCount = len(slots)
+    sideSize = 64 ** pieceCount
+    values = bytearray(2 * sideSize)
+    remaining = bytearray(2 * sideSize) #Moves of a legal, unresolved position not yet known to lose. 0 once resolved, and for illegal positions.
+    resolved = [[] for _ in range(LOSS)] #Positions resolved at each ply, worked through in order.
+    conversions = [[] for _ in range(LOSS)] #(position, whether the other side is mated) for captures and promotions into another table, by ply.
+    pawnSlots = [i for i in range(pieceCount) if slots[i][1] == "P"]
+    whiteKing, blackKing = slots.index("wK"), slots.index("bK")
+
+    #Forward pass: count every legal position's moves, find the Checkmates and look up the captures and promotions.
+
+    gs = chessEngineSmart.newGameState(backend)
+    gs.board = [["--"] * 8 for _ in range(8)]
+    gs.currentCastlingRights = castleRights(False, False, False, False)
+    gs.enPassantPossible = ()
+    for offset, squares in enumerate(itertools.product(range(64), repeat = pieceCount)):
+        if len(set(squares)) < pieceCount or any(squares[i] < 8 or squares[i] >= 56 for i in pawnSlots):
+            continue
+        pieces = list(zip(slots, squares))
+        for piece, square in pieces:
+            gs.board[square // 8][square % 8] = piece
+        gs.whiteKingLocation = divmod(squares[whiteKing], 8)
+        gs.blackKingLocation = divmod(squares[blackKing], 8)
+        if backend == "bitboard":
+            gs.loadBitboards()
+        for side in (0, 1):
+            gs.whiteToMove = side == 0
+            enemyKing = gs.blackKingLocation if gs.whiteToMove else gs.whiteKingLocation
+            if gs.isSquareAttacked(enemyKing[0], enemyKing[1], "w" if gs.whiteToMove else "b"):
+                continue #The side that just moved left its King in Check.
+            index = side * sideSize + offset
+            moves = gs.getValidMoves()
+            if len(moves) == 0:
+                if gs.inCheck:
+                    values[index] = LOSS
+                    resolved[0].append(index)
+                continue
+            remaining[index] = len(moves)
+            for move in moves:
+                if move.pieceCaptured == "--" and not move.pawnPromotion:
+                    continue
+                moveStart = move.startRow * 8 + move.startCol
+                moveEnd = move.endRow * 8 + move.endCol
+                child = [(piece, square) for piece, square in pieces if square != moveStart and square != moveEnd]
+                child.append((move.pieceMoved[0] + move.promotionChoice if move.pawnPromotion else move.pieceMoved, moveEnd))
+                value = tablebases.probePieces(child, not gs.whiteToMove)
+                if value is None:
+                    raise RuntimeError("Missing table for " + getSignature([piece for piece, square in child]))
+                if value >= LOSS:
+                    conversions[value - LOSS].append((index, True))
+                elif value != DRAW:
+                    conversions[value].append((index, False))
+        for piece, square in pieces:
+            gs.board[square // 8][square % 8] = "--"
+    tablebases.close()
+
+    #Retrograde pass. A position whose move leads to a lost position for the opponent wins one ply later, the first time that happens is its shortest mate.
+    #A position all of whose moves lead to won positions for the opponent loses one ply after the last (longest) of them.
+
+    weights = [64 ** (pieceCount - 1 - i) for i in range(pieceCount)]
+    longest = 0
+    for ply in range(LOSS - 1):
+        newlyResolved = resolved[ply + 1]
+        for index in resolved[ply]:
+            longest = ply
+            lost = values[index] >= LOSS
+            side, rest = divmod(index, sideSize)
+            squares = [rest // weight % 64 for weight in weights]
+            occupied = set(squares)
+            mover = "b" if side == 0 else "w" #The side not to move made the last move.
+            parentBase = (1 - side) * sideSize + rest
+            for i in range(pieceCount):
+                if slots[i][0] != mover:
+                    continue
+                for origin in getRetroSquares(slots[i], squares[i], occupied):
+                    parent = parentBase + (origin - squares[i]) * weights[i]
+                    if remaining[parent] == 0:
+                        continue
+                    if lost:
+                        values[parent] = ply + 1
+                        remaining[parent] = 0
+                        newlyResolved.append(parent)
+                    else:
+                        remaining[parent] -= 1
+                        if remaining[parent] == 0:
+                            values[parent] = LOSS + ply + 1
+                            newlyResolved.append(parent)
+        for parent, lost in conversions[ply]:
+            if remaining[parent] == 0:
+                continue
+            if lost:
+                values[parent] = ply + 1
+                remaining[parent] = 0
+                newlyResolved.append(parent)
+            else:
+                remaining[parent] -= 1
+                if remaining[parent] == 0:
+                    values[parent] = LOSS + ply + 1
+                    newlyResolved.append(parent)
+        resolved[ply] = None
+    if resolved[LOSS - 1]:
+        raise RuntimeError(signature + " has mates longer than " + str(LOSS - 2) + " plies, they do not fit the table format")
+
+    path = getTablePath(directory, signature)
+    with open(path + ".tmp", "wb") as tableFile: #Written under another name first, so a half-written table is never probed.
+        tableFile.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, pieceCount))
+        tableFile.write(values)
+    os.replace(path + ".tmp", path)
+    wins = sum(1 for value in values if 0 < value < LOSS)
+    losses = sum(1 for value in values if value >= LOSS)
+    print(signature + ": " + str(wins) + " wins, " + str(losses) + " losses, longest mate " + str(longest) + " plies, " + format(time.perf_counter() - start, ".1f") + "s")
+    return longest
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Generate endgame tablebases by retrograde analysis.")
+    parser.add_argument("signatures", nargs = "*", default = list(DEFAULT_SIGNATURES), help = "material to generate, e.g. KQvK KRvK KPvK KQvKR (default: KQvK KRvK KPvK)")
+    parser.add_argument("--dir", default = TABLEBASE_DIR, help = "directory the .tb files are written to")
+    parser.add_argument("--backend", choices = ("mailbox", "bitboard"), default = "bitboard")
+    args = parser.parse_args(argv)
+    for signature in args.signatures:
+        signature = canonicalSignature(signature)
+        if signature in DRAWN_SIGNATURES:
+            print(signature + " is always a draw, it needs no table.")
+        elif os.path.exists(getTablePath(args.dir, signature)):
+            print(signature + " already exists.")
+        else:
+            generateTable(signature, args.dir, args.backend)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
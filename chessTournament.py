@@ -0,0 +1,315 @@
+# Headless self-play tournament. Plays games between two engine configurations on a pool of processes, without pygame, and writes them to a PGN file
+#followed by a summary: wins/draws/losses, an Elo difference with its 95% error bars, and each engine's average depth, nodes/sec and time per move.
+#An engine is "random" (findRandomMove) or findBestMove with chessBot settings overridden, e.g. "TIME_LIMIT=0.5,USE_TABLEBASES=False".
+#Every opening is played twice with the colors swapped, so neither engine gets the better side of an opening more often.
+#Usage: python chessTournament.py --games 40 --engine-a "BATCH_EVALUATION=True" --engine-b "" [--time 0.2] [--workers 4] [--pgn tournament.pgn]
+
+import argparse
+import ast
+import math
+import multiprocessing
+import queue
+import sys
+import time
+import chessEngineSmart
+import chessBot
+import chessEPD
+from chessEvaluation import PIECE_VALUES
+
+MAX_PLIES = 300 #Games still going after this many plies are adjudicated a draw.
+ELO_Z = 1.96 #Width of the Elo error bars in standard deviations (95%).
+
+#Short, balanced opening lines in long algebraic notation, played from the start position before the engines take over.
+
+OPENINGS = [
+    ("Ruy Lopez", "e2e4 e7e5 g1f3 b8c6 f1b5 a7a6"),
+    ("Italian Game", "e2e4 e7e5 g1f3 b8c6 f1c4 f8c5"),
+    ("Sicilian Najdorf", "e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 a7a6"),
+    ("French Defence", "e2e4 e7e6 d2d4 d7d5 b1c3 g8f6"),
+    ("Caro-Kann Defence", "e2e4 c7c6 d2d4 d7d5 e4e5 c8f5"),
+    ("Scandinavian Defence", "e2e4 d7d5 e4d5 d8d5 b1c3 d5a5"),
+    ("Queen's Gambit Declined", "d2d4 d7d5 c2c4 e7e6 b1c3 g8f6"),
+    ("Slav Defence", "d2d4 d7d5 c2c4 c7c6 g1f3 g8f6"),
+    ("King's Indian Defence", "d2d4 g8f6 c2c4 g7g6 b1c3 f8g7 e2e4 d7d6"),
+    ("Nimzo-Indian Defence", "d2d4 g8f6 c2c4 e7e6 b1c3 f8b4"),
+    ("English Opening", "c2c4 e7e5 b1c3 g8f6 g2g3 d7d5"),
+    ("Reti Opening", "g1f3 d7d5 c2c4 e7e6 g2g3 g8f6"),
+]
+
+#Reads an engine description into (name, settings). "random" plays random moves, anything else is a comma separated list of chessBot settings ("" for the defaults).
+
+def parseEngine(description):
+    description = description.strip()
+    if description == "random":
+        return ("random", None)
+    settings = {}
+    for assignment in description.split(","):
+        if not assignment.strip():
+            continue
+        name, _, value = assignment.partition("=")
+        name = name.strip()
+        if not name.isupper() or not hasattr(chessBot, name):
+            raise ValueError("Unknown chessBot setting: " + name)
+        settings[name] = ast.literal_eval(value.strip())
+    return (description if description else "default", settings)
+
+#Standard algebraic notation of a move, e.g. "Nbd7", "exd5", "e8=Q", "O-O". The "+"/"#" suffix is added once the reply's moves are known.
+
+def getSAN(move, validMoves):
+    if move.castleMove:
+        return "O-O" if move.endCol == 6 else "O-O-O"
+    end = move.getRankFile(move.endRow, move.endCol)
+    if move.pieceMoved[1] == "P":
+        san = (move.colsToFiles[move.startCol] + "x" + end) if move.isCapture else end
+        return san + ("=" + move.promotionChoice if move.pawnPromotion else "")
+    rivals = [other for other in validMoves if other.pieceMoved == move.pieceMoved and other.endRow == move.endRow and other.endCol == move.endCol and
+              (other.startRow, other.startCol) != (move.startRow, move.startCol)]
+    disambiguation = ""
+    if rivals:
+        if all(other.startCol != move.startCol for other in rivals):
+            disambiguation = move.colsToFiles[move.startCol]
+        elif all(other.startRow != move.startRow for other in rivals):
+            disambiguation = move.rowsToRanks[move.startRow]
+        else:
+            disambiguation = move.getRankFile(move.startRow, move.startCol)
+    return move.pieceMoved[1] + disambiguation + ("x" if move.isCapture else "") + end
+
+#True when neither side has the material left to give Checkmate: bare Kings, or a single Bishop or Knight against a bare King.
+
+def isInsufficientMaterial(gs):
+    return gs.material["w"] + gs.material["b"] <= PIECE_VALUES["B"] and not any(piece[1] == "P" for row in gs.board for piece in row)
+
+#Plays one game in a pool process. 'task' is (game index, opening name, FEN, opening moves, white engine, black engine, backend).
+#Returns the game's record: result, termination, the moves in SAN and each engine's search statistics.
+
+def playGame(task):
+    gameIndex, openingName, fen, openingMoves, white, black, backend = task
+    gs = chessEngineSmart.newGameState(backend)
+    gs.loadFEN(fen)
+    startWhite = gs.whiteToMove
+    sanMoves = []
+    for notation in openingMoves:
+        validMoves = gs.getValidMoves()
+        if sanMoves and gs.inCheck:
+            sanMoves[-1] += "+"
+        move = next((move for move in validMoves if move.getUCINotation() == notation), None)
+        if move is None:
+            raise ValueError(openingName + ": illegal opening move " + notation)
+        sanMoves.append(getSAN(move, validMoves))
+        gs.makeMove(move)
+    engines = {"w": white, "b": black}
+    tables = {"w": None, "b": None} #Each engine keeps its own transposition table from move to move.
+    orderings = {"w": None, "b": None} #And its own killer and history tables, so neither engine's move ordering is shaped by the other's searches.
+    sharedOrdering = (chessBot.killers, chessBot.history)
+    defaults = {}
+    statistics = {"w": [0, 0, 0, 0.0, 0], "b": [0, 0, 0, 0.0, 0]} #Moves, summed depth, nodes, seconds, searched moves (book and table moves have no depth).
+    result = None
+    while result is None:
+        validMoves = gs.getValidMoves()
+        if sanMoves and gs.inCheck:
+            sanMoves[-1] += "#" if len(validMoves) == 0 else "+"
+        if len(validMoves) == 0:
+            if gs.inCheck:
+                result, termination = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+            else:
+                result, termination = "1/2-1/2", "stalemate"
+        elif gs.isRepetition(3):
+            result, termination = "1/2-1/2", "threefold repetition"
+        elif gs.isFiftyMoveDraw():
+            result, termination = "1/2-1/2", "fifty-move rule"
+        elif isInsufficientMaterial(gs):
+            result, termination = "1/2-1/2", "insufficient material"
+        elif len(gs.moveLog) >= MAX_PLIES:
+            result, termination = "1/2-1/2", "adjudicated after " + str(MAX_PLIES) + " plies"
+        if result is not None:
+            break
+        color = "w" if gs.whiteToMove else "b"
+        settings = engines[color][1]
+        start = time.perf_counter()
+        if settings is None:
+            move = chessBot.findRandomMove(validMoves)
+            depth, nodes = 0, 0
+        else:
+            for setting, value in settings.items():
+                defaults.setdefault(setting, getattr(chessBot, setting))
+            for setting, value in defaults.items():
+                setattr(chessBot, setting, settings.get(setting, value))
+            chessBot.table = tables[color]
+            if orderings[color] is None:
+                orderings[color] = ([[None, None] for _ in sharedOrdering[0]], {piece: [0] * 64 for piece in sharedOrdering[1]})
+            chessBot.killers, chessBot.history = orderings[color]
+            depthReached = [0]
+
+            def reportIteration(depth, score, nodes, seconds, pv):
+                depthReached[0] = depth
+
+            returnQueue = queue.Queue()
+            chessBot.findBestMove(gs, list(validMoves), returnQueue, chessBot.TIME_LIMIT, chessBot.NODE_LIMIT, chessBot.MAX_DEPTH, reportIteration)
+            move = returnQueue.get()
+            if chessBot.COLLECT_STATISTICS:
+                move = move[0] #(move, statistics), the tournament keeps its own counts.
+            tables[color] = chessBot.table
+            depth, nodes = depthReached[0], chessBot.nodesSearched
+            if move is None:
+                move = chessBot.findRandomMove(validMoves)
+        moveStatistics = statistics[color]
+        moveStatistics[0] += 1
+        moveStatistics[1] += depth
+        moveStatistics[2] += nodes
+        moveStatistics[3] += time.perf_counter() - start
+        if depth > 0:
+            moveStatistics[4] += 1
+        sanMoves.append(getSAN(move, validMoves))
+        gs.makeMove(move)
+    for setting, value in defaults.items():
+        setattr(chessBot, setting, value)
+    chessBot.table = None
+    chessBot.killers, chessBot.history = sharedOrdering
+    return {"index": gameIndex, "opening": openingName, "fen": fen, "startWhite": startWhite, "white": white[0], "black": black[0],
+            "result": result, "termination": termination, "moves": sanMoves, "statistics": statistics}
+
+#One game in PGN: the tag pairs, then the moves numbered from the starting position and the termination as a comment.
+
+def formatPGN(game, event):
+    tags = [("Event", event), ("Site", "?"), ("Date", time.strftime("%Y.%m.%d")), ("Round", str(game["index"] + 1)),
+            ("White", game["white"]), ("Black", game["black"]), ("Result", game["result"]), ("Opening", game["opening"])]
+    if game["fen"] != chessEngineSmart.START_FEN:
+        tags += [("SetUp", "1"), ("FEN", game["fen"])]
+    lines = ["[" + tag + " \"" + value.replace("\\", "\\\\").replace("\"", "\\\"") + "\"]" for tag, value in tags]
+    moveNumber = int(game["fen"].split()[5]) if len(game["fen"].split()) > 5 else 1
+    tokens = []
+    whiteToMove = game["startWhite"]
+    for i, san in enumerate(game["moves"]):
+        if whiteToMove:
+            tokens.append(str(moveNumber) + ".")
+        elif i == 0:
+            tokens.append(str(moveNumber) + "...")
+        tokens.append(san)
+        if not whiteToMove:
+            moveNumber += 1
+        whiteToMove = not whiteToMove
+    tokens += ["{" + game["termination"] + "}", game["result"]]
+    movetext = []
+    line = ""
+    for token in tokens: #PGN lines are kept under 80 characters.
+        if line and len(line) + 1 + len(token) > 79:
+            movetext.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    movetext.append(line)
+    return "\n".join(lines) + "\n\n" + "\n".join(movetext) + "\n\n"
+
+#Elo difference matching a score fraction, +-infinity for a clean sweep.
+
+def getEloDifference(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+#Elo difference of engine A over engine B from their game results, with the bounds of its error bars. Returns (elo, low, high).
+
+def estimateElo(wins, draws, losses, z = ELO_Z):
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, -math.inf, math.inf
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games #Of a single game's score.
+    margin = z * math.sqrt(variance / games)
+    return getEloDifference(score), getEloDifference(score - margin), getEloDifference(score + margin)
+
+#The summary printed and written after the tournament, from engine A's point of view.
+
+def formatSummary(games, engineA, engineB):
+    wins = draws = losses = 0
+    totals = {engineA: [0, 0, 0, 0.0, 0], engineB: [0, 0, 0, 0.0, 0]}
+    terminations = {}
+    for game in games:
+        if game["result"] == "1/2-1/2":
+            draws += 1
+        elif (game["result"] == "1-0") == (game["white"] == engineA):
+            wins += 1
+        else:
+            losses += 1
+        terminations[game["termination"]] = terminations.get(game["termination"], 0) + 1
+        for color, name in (("w", game["white"]), ("b", game["black"])):
+            for i in range(5):
+                totals[name][i] += game["statistics"][color][i]
+    elo, low, high = estimateElo(wins, draws, losses)
+    score = (wins + 0.5 * draws) / len(games) if games else 0.0
+    lines = ["A: " + engineA, "B: " + engineB,
+             "Games " + str(len(games)) + ": A +" + str(wins) + " =" + str(draws) + " -" + str(losses) + ", score " + format(100 * score, ".1f") + "%",
+             "Elo difference A - B: " + format(elo, "+.1f") + " (95% interval " + format(low, "+.1f") + " to " + format(high, "+.1f") + ")",
+             "Endings: " + ", ".join(termination + " " + str(count) for termination, count in sorted(terminations.items()))]
+    for label, name in (("A", engineA), ("B", engineB)):
+        moves, depth, nodes, seconds, searchedMoves = totals[name]
+        if moves > 0:
+            lines.append(label + ": " + str(moves) + " moves, average depth " + (format(depth / searchedMoves, ".2f") if searchedMoves > 0 else "-") + ", " +
+                         format(nodes / seconds if seconds > 0 else 0.0, ",.0f") + " nodes/sec, " + format(seconds / moves, ".3f") + "s per move")
+    return "\n".join(lines) + "\n"
+
+#Plays 'games' games between two engines, written as (name, settings) by parseEngine. Openings are a list of (name, FEN, moves in long algebraic notation).
+#Engine A plays White in the even numbered games. Returns the game records in the order they were played.
+
+def runTournament(engineA, engineB, games, openings, workers = None, pgnPath = None, backend = "bitboard", event = "Self-play"):
+    if engineA[0] == engineB[0]:
+        engineB = (engineB[0] + " (B)", engineB[1])
+    tasks = []
+    for gameIndex in range(games):
+        openingName, fen, openingMoves = openings[gameIndex // 2 % len(openings)]
+        white, black = (engineA, engineB) if gameIndex % 2 == 0 else (engineB, engineA)
+        tasks.append((gameIndex, openingName, fen, openingMoves, white, black, backend))
+    results = []
+    pgnFile = open(pgnPath, "w") if pgnPath is not None else None
+    pool = multiprocessing.Pool(workers)
+    try:
+        for game in pool.imap_unordered(playGame, tasks):
+            results.append(game)
+            if pgnFile is not None:
+                pgnFile.write(formatPGN(game, event))
+                pgnFile.flush()
+            print(format(game["index"] + 1, "4d") + " " + game["white"] + " - " + game["black"] + " " + game["result"] + " (" + game["termination"] + ", " +
+                  game["opening"] + ", " + str(len(game["moves"])) + " plies)")
+    finally:
+        pool.close()
+        pool.join()
+        if pgnFile is not None:
+            pgnFile.close()
+    summary = formatSummary(results, engineA[0], engineB[0])
+    print(summary, end = "")
+    if pgnPath is not None:
+        with open(pgnPath + ".txt", "w") as summaryFile:
+            summaryFile.write(summary)
+    return sorted(results, key = lambda game: game["index"])
+
+#Openings from an EPD file (one starting position per line, named by its "id" operation) or the built-in OPENINGS.
+
+def loadOpenings(epdPath = None):
+    if epdPath is None:
+        return [(name, chessEngineSmart.START_FEN, moves.split()) for name, moves in OPENINGS]
+    return [(" ".join(operations.get("id", [str(index + 1)])), fen + " 0 1", []) for index, fen, operations in chessEPD.readEPD(epdPath)]
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Self-play tournament between two engine configurations.")
+    parser.add_argument("--games", type = int, default = 2 * len(OPENINGS))
+    parser.add_argument("--engine-a", default = "", help = "'random' or chessBot settings, e.g. \"TIME_LIMIT=0.5,BATCH_EVALUATION=True\" (default: the current settings)")
+    parser.add_argument("--engine-b", default = "", help = "same as --engine-a")
+    parser.add_argument("--time", type = float, default = 0.2, help = "seconds per move for engines that do not set TIME_LIMIT")
+    parser.add_argument("--openings", default = None, help = "EPD file of starting positions (default: the built-in opening lines)")
+    parser.add_argument("--workers", type = int, default = None, help = "game processes (default: one per core)")
+    parser.add_argument("--pgn", default = "tournament.pgn", help = "PGN file the games are written to, the summary goes to the same name + .txt")
+    parser.add_argument("--backend", choices = ("mailbox", "bitboard"), default = "bitboard")
+    args = parser.parse_args(argv)
+    engines = []
+    for description in (args.engine_a, args.engine_b):
+        name, settings = parseEngine(description)
+        if settings is not None:
+            settings.setdefault("TIME_LIMIT", args.time)
+        engines.append((name, settings))
+    runTournament(engines[0], engines[1], args.games, loadOpenings(args.openings), args.workers, args.pgn, args.backend)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+# UCI front end. Drives gameState and chessBot over stdin/stdout so the engine can run under standard tournament managers, without pygame.
+#Supports uci, isready, setoption (Threads), ucinewgame, position (startpos/fen + moves), go (wtime/btime/winc/binc/movestogo/movetime/depth/nodes/infinite), stop and quit.
+#Threads sets chessBot.SMP_WORKERS, more than 1 searches with chessParallel's Lazy SMP.
+#The search runs on a second thread. 'stop' is seen by chessBot's stopRequest check every CHECK_EVERY nodes, which bounds the time until bestmove is sent.
+#Usage: python chessUCI.py [--backend mailbox]
+
+import argparse
+import sys
+import threading
+import chessEngineSmart
+import chessBot
+
+ENGINE_NAME = "ChessEngine"
+ENGINE_AUTHOR = "DomMorabito830"
+MOVES_TO_GO = 30 #Moves the remaining clock time is shared between when the GUI does not say.
+TIME_SAFETY = 0.05 #Seconds kept back from every move for the GUI and process overhead.
+MAX_THREADS = 64
+
+class uciEngine():
+
+    def __init__(self, backend = "bitboard", output = sys.stdout):
+        self.backend = backend
+        self.output = output
+        self.gs = chessEngineSmart.newGameState(backend)
+        self.searchThread = None
+        self.stopEvent = threading.Event()
+        self.infinite = False
+
+    def send(self, line):
+        self.output.write(line + "\n")
+        self.output.flush()
+
+    #Handles one line from the GUI. Returns False after "quit".
+
+    def handleCommand(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Threads type spin default " + str(chessBot.SMP_WORKERS) + " min 1 max " + str(MAX_THREADS))
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.stopSearch()
+            self.setOption(tokens[1:])
+        elif command == "ucinewgame":
+            self.stopSearch()
+            self.gs = chessEngineSmart.newGameState(self.backend)
+            if chessBot.table is not None:
+                chessBot.table.clear()
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(tokens[1:])
+        elif command == "go":
+            self.stopSearch()
+            self.go(tokens[1:])
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        return True
+
+    #"setoption name Threads value 4". Unknown options are ignored, as UCI asks.
+
+    def setOption(self, tokens):
+        if "name" not in tokens or "value" not in tokens:
+            return
+        name = " ".join(tokens[tokens.index("name") + 1:tokens.index("value")])
+        value = " ".join(tokens[tokens.index("value") + 1:])
+        if name.lower() == "threads" and value.isdigit():
+            chessBot.SMP_WORKERS = min(max(int(value), 1), MAX_THREADS)
+
+    #"position startpos moves e2e4 ..." or "position fen <6 fields> moves ...".
+
+    def setPosition(self, tokens):
+        if "moves" in tokens:
+            moves = tokens[tokens.index("moves") + 1:]
+            tokens = tokens[:tokens.index("moves")]
+        else:
+            moves = []
+        self.gs = chessEngineSmart.newGameState(self.backend)
+        if tokens and tokens[0] == "fen":
+            self.gs.loadFEN(" ".join(tokens[1:]))
+        for notation in moves:
+            move = self.getMoveFromUCI(notation)
+            if move is None:
+                self.send("info string illegal move " + notation)
+                return
+            self.gs.makeMove(move)
+
+    def getMoveFromUCI(self, notation):
+        for move in self.gs.getValidMoves():
+            if move.getUCINotation() == notation:
+                return move
+        return None
+
+    #Reads the go parameters into (time limit, node limit, max depth) and starts the search thread.
+
+    def go(self, tokens):
+        options = {}
+        self.infinite = False
+        i = 0
+        while i < len(tokens):
+            if tokens[i] == "infinite":
+                self.infinite = True
+            elif i + 1 < len(tokens) and tokens[i] in ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes"):
+                options[tokens[i]] = int(tokens[i + 1])
+                i += 1
+            i += 1
+        timeLimit = self.getTimeLimit(options)
+        nodeLimit = options.get("nodes")
+        maxDepth = min(options.get("depth", chessBot.MAX_DEPTH), chessBot.MAX_DEPTH)
+        self.stopEvent.clear()
+        self.searchThread = threading.Thread(target = self.search, args = (timeLimit, nodeLimit, maxDepth), daemon = True)
+        self.searchThread.start()
+
+    #Seconds to spend on this move: movetime if given, otherwise a share of the side to move's clock plus most of its increment. None means no time limit.
+
+    def getTimeLimit(self, options):
+        if self.infinite:
+            return None
+        if "movetime" in options:
+            return max(options["movetime"] / 1000 - TIME_SAFETY, 0.01)
+        clock, increment = ("wtime", "winc") if self.gs.whiteToMove else ("btime", "binc")
+        if clock not in options:
+            return None if "depth" in options or "nodes" in options else chessBot.TIME_LIMIT
+        remaining = options[clock] / 1000
+        share = remaining / options.get("movestogo", MOVES_TO_GO) + 0.8 * options.get(increment, 0) / 1000
+        return max(min(share, remaining / 2) - TIME_SAFETY, 0.01)
+
+    #Runs on the search thread. Sends an info line per completed iteration, then bestmove (after "stop" when searching infinite).
+    #bestmove is sent even if the search fails, a GUI waiting for it would otherwise hang until its own timeout.
+
+    def search(self, timeLimit, nodeLimit, maxDepth):
+        bestMove = None
+        try:
+            chessBot.stopRequest = self.stopEvent.is_set
+            bestMove = chessBot.iterativeDeepening(self.gs, self.gs.getValidMoves(), timeLimit, nodeLimit, maxDepth, self.sendInfo)
+        except Exception as error:
+            self.send("info string search failed: " + repr(error))
+        finally:
+            chessBot.stopRequest = None
+            if bestMove is None:
+                validMoves = self.gs.getValidMoves()
+                bestMove = validMoves[0] if validMoves else None #"bestmove 0000" loses on forfeit, any legal move is better.
+            if self.infinite:
+                self.stopEvent.wait() #UCI: no bestmove before "stop" in infinite mode.
+            self.send("bestmove " + (bestMove.getUCINotation() if bestMove is not None else "0000"))
+
+    def sendInfo(self, depth, score, nodes, seconds, pv):
+        if abs(score) >= chessBot.MATE_SCORE:
+            plies = chessBot.CHECKMATE - abs(score) #Mate scores count the plies to the mate.
+            scoreText = "mate " + str((plies + 1) // 2 if score > 0 else -(plies // 2))
+        else:
+            scoreText = "cp " + str(score)
+        pvText = []
+        gs = self.gs #Walk the PV on the board to turn move IDs into notation. Called from inside the search between iterations, so the board is at the root.
+        for moveID in pv:
+            move = gs.getMoveFromID(moveID)
+            if move is None:
+                break
+            pvText.append(move.getUCINotation())
+            gs.makeMove(move)
+        for _ in pvText:
+            gs.undoMove()
+        self.send("info depth " + str(depth) + " score " + scoreText + " nodes " + str(nodes) + " nps " + str(int(nodes / seconds) if seconds > 0 else 0) +
+                  " time " + str(int(seconds * 1000)) + " pv " + " ".join(pvText))
+
+    #Stops a running search and waits for its bestmove to be sent.
+
+    def stopSearch(self):
+        if self.searchThread is not None:
+            self.stopEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "UCI protocol front end.")
+    parser.add_argument("--backend", choices = ("mailbox", "bitboard"), default = "bitboard")
+    parser.add_argument("--threads", type = int, default = chessBot.SMP_WORKERS, help = "search processes (Lazy SMP above 1), the GUI can change it with setoption")
+    args = parser.parse_args(argv)
+    chessBot.SMP_WORKERS = min(max(args.threads, 1), MAX_THREADS)
+    engine = uciEngine(args.backend)
+    commands = open(sys.stdin.fileno(), closefd = False) #Not sys.stdin itself: a Lazy SMP search process forked while this waits for a line would hang closing sys.stdin on the lock the wait holds.
+    for line in commands:
+        if not engine.handleCommand(line.strip()):
+            break
+    engine.stopSearch()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())